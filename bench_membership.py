@@ -0,0 +1,106 @@
+"""Compare a compact WordlistCache against the default one.
+
+The default cache keeps the words as str objects in wordlist, word_by_length
+and the words_set hash table; the compact one packs them into PackedWords
+arenas. Reports load time including indexes, the memory the loaded cache holds
+and words_set lookup latency (hits and misses).
+
+Usage:
+    python bench_membership.py path/to/wordlist.txt
+    python bench_membership.py --synthetic 2000000
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+
+from final_wordfinder import WordlistCache
+
+
+def synthetic_wordlist(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < count:
+        length = rng.randint(3, 15)
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+    return sorted(words)
+
+
+def measure_load(path: str, compact: bool):
+    tracemalloc.start()
+    start = time.perf_counter()
+    cache = WordlistCache(compact_membership=compact)
+    cache.load_wordlist(path)
+    while not cache.indexes.all_ready():
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cache, elapsed, current
+
+
+def measure_lookups(structure, probes, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for word in probes:
+            word in structure
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wordlist", nargs="?", help="wordlist file, one word per line")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate this many random words instead of reading a file")
+    parser.add_argument("--lookups", type=int, default=200000, help="number of probe words per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, best is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    temp_path = None
+    if args.synthetic:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("\n".join(synthetic_wordlist(args.synthetic, args.seed)))
+            temp_path = f.name
+        path = temp_path
+    elif args.wordlist:
+        path = args.wordlist
+    else:
+        parser.error("give a wordlist path or --synthetic N")
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name, compact in (("set", False), ("compact", True)):
+        cache, load_time, memory = measure_load(path, compact)
+        words = cache.wordlist
+        if not words:
+            parser.error("wordlist is empty")
+        if not results:
+            hits = [rng.choice(words) for _ in range(args.lookups // 2)]
+            # Swap the last letter so most probes miss but still hit a populated length bucket
+            misses = [w[:-1] + rng.choice(string.ascii_lowercase) for w in (rng.choice(words) for _ in range(args.lookups // 2))]
+        results[name] = (
+            load_time,
+            memory,
+            measure_lookups(cache.words_set, hits, args.repeat),
+            measure_lookups(cache.words_set, misses, args.repeat),
+        )
+        word_count = len(words)
+        del cache, words
+    if temp_path is not None:
+        os.remove(temp_path)
+
+    print(f"{word_count} words, {args.lookups} probes (half hits, mostly misses otherwise)")
+    print(f"{'cache':<10} {'load s':>9} {'memory MiB':>11} {'bytes/word':>11} {'hit ns':>8} {'miss ns':>8}")
+    for name, (load_time, memory, hit, miss) in results.items():
+        print(f"{name:<10} {load_time:>9.2f} {memory / 2**20:>11.1f} {memory / word_count:>11.1f} {hit * 1e9:>8.0f} {miss * 1e9:>8.0f}")
+    print("load time and memory include the anagram and split indexes, which the compact cache does not build")
+
+
+if __name__ == "__main__":
+    main()
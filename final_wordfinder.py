@@ -1,25 +1,94 @@
 import streamlit as st
+import argparse
+import csv
+import json
 import re
+import sys
+import tempfile
 import string
 import time
-from collections import defaultdict
+import array
+import bisect
+from collections import Counter, defaultdict, OrderedDict
+from collections.abc import Sequence
 import concurrent.futures
 import os
 import itertools
-from typing import Dict, List, Tuple, Set, Optional, Union
+import math
+import random
+import multiprocessing
+from typing import Callable, Dict, FrozenSet, Iterator, List, Mapping, Tuple, Set, Optional, Union
+from types import MappingProxyType
 import functools
+import hashlib
 import threading
-from dataclasses import dataclass
+import uuid
+import weakref
+from dataclasses import dataclass, field
 from enum import Enum
 
-st.set_page_config(
-    page_title="Word Pattern Matcher",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # older Streamlit releases
+    add_script_run_ctx = get_script_run_ctx = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
 VOWELS = set("aeiou")
 CONSONANTS = set(string.ascii_lowercase) - VOWELS
 
+# Persistent QAT domain cache; the warm-up list uses the "length:pattern" part of a variable definition
+DOMAIN_CACHE_DIR = os.environ.get("WORDFINDER_DOMAIN_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".domain_cache"))
+DOMAIN_CACHE_MAX_BYTES = int(os.environ.get("WORDFINDER_DOMAIN_CACHE_MB", "512")) * 1024 * 1024
+DOMAIN_WARMUP = [d for d in os.environ.get("WORDFINDER_DOMAIN_WARMUP", "2:*;3:*;4:*").split(";") if d]
+DOMAIN_WARMUP_TIMEOUT = 3600
+
+# Display sort orders for stored results (see QueryRun.view)
+RESULT_SORT_ORDERS = {"Solver order": "solver", "Alphabetical": "alphabetical", "Length": "length"}
+
+# Compiled query plans, shared by every session (see PatternMatcher.compile_query)
+PLAN_CACHE_SIZE = 256
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+# Process-wide query scheduler; costs are estimated candidate checks (see PatternMatcher.estimate_query_cost)
+QUERY_WORKERS = int(os.environ.get("WORDFINDER_QUERY_WORKERS", "4"))
+QUERY_MAX_COST = float(os.environ.get("WORDFINDER_QUERY_MAX_COST", "1e11"))
+QUERY_DOWNGRADE_COST = float(os.environ.get("WORDFINDER_QUERY_DOWNGRADE_COST", "1e8"))
+QUERY_DOWNGRADE_TIMEOUT = int(os.environ.get("WORDFINDER_QUERY_DOWNGRADE_TIMEOUT", "60"))
+
+# Estimate mode (see PatternMatcher.estimate_query)
+ESTIMATE_TIME_BUDGET = 0.5
+ESTIMATE_MAX_SAMPLES = 20000
+ESTIMATE_SAMPLE_MATCHES = 20
+# Share of an estimate's time budget that may go to building QAT domains so they can be sampled exactly
+ESTIMATE_DOMAIN_BUILD_SHARE = 0.5
+
+# QAT composite solves return at most this many results (the product walk stops there)
+COMPOSITE_RESULT_CAP = 10001
+
+# Full-result exports (see export_query): label -> (format, file extension, MIME type)
+EXPORT_FORMATS = {
+    "JSON Lines": ("jsonl", "jsonl", "application/x-ndjson"),
+    "CSV": ("csv", "csv", "text/csv"),
+    "Plain text": ("txt", "txt", "text/plain"),
+}
+# Exports are written under the app's static folder so that, with server.enableStaticServing
+# on, the browser downloads them straight from disk; Streamlit serves static files up to 200 MB
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+EXPORT_DIR = os.path.join(STATIC_DIR, "exports")
+STATIC_SERVING_MAX_BYTES = 200 * 1024 * 1024
+EXPORT_MAX_AGE = 24 * 3600  # seconds before an export left behind by a crashed server is removed
+
+# Isolated query processes (see run_isolated_query); the memory limit is on top of what the server already uses
+ISOLATION_AVAILABLE = "fork" in multiprocessing.get_all_start_methods()
+ISOLATION_MEMORY_MB = int(os.environ.get("WORDFINDER_ISOLATION_MEMORY_MB", "2048"))
+ISOLATION_KILL_GRACE = 5
+ISOLATION_CHUNK_SIZE = 1000
+
 class PatternType(Enum):
     SIMPLE = "simple"
     EQUATION = "equation"
@@ -43,18 +112,543 @@ class PatternStructure:
     total_length: int
     original: str
 
-class WordlistCache:
+@dataclass(frozen=True)
+class PatternSegment:
+    offset: int
+    length: int
+    var_name: Optional[str] = None  # None for a literal character
+    is_reversed: bool = False
+    literal: str = ""
+
+
+@dataclass(frozen=True)
+class CompiledPattern:
+    """An equation pattern laid out as segments at fixed offsets in the matched word."""
+    structure: PatternStructure
+    segments: Tuple[PatternSegment, ...]
+
+    @property
+    def original(self) -> str:
+        return self.structure.original
+
+    @property
+    def total_length(self) -> int:
+        return self.structure.total_length
+
+    @property
+    def variables(self) -> List[Tuple[str, bool]]:
+        return self.structure.variables
+
+    @property
+    def has_reversed(self) -> bool:
+        return any(is_reversed for _, is_reversed in self.structure.variables)
+
+    @property
+    def split_lengths(self) -> Optional[Tuple[int, int]]:
+        """(m, n) if the pattern is just two forward variables back to back, like AB, else None."""
+        if len(self.segments) != 2 or any(s.var_name is None or s.is_reversed for s in self.segments):
+            return None
+        return self.segments[0].length, self.segments[1].length
+
+    def decompose(self, word: str, matchers: Mapping[str, Callable[[str], object]]) -> Optional[Dict[str, str]]:
+        """Split word into variable values, or None if a literal, matcher or repeated variable disagrees."""
+        if len(word) != self.structure.total_length:
+            return None
+        decomp = {}
+        for segment in self.segments:
+            part = word[segment.offset:segment.offset + segment.length]
+            if segment.var_name is None:
+                if part != segment.literal:
+                    return None
+                continue
+            value = part[::-1] if segment.is_reversed else part
+            bound = decomp.get(segment.var_name)
+            if bound is None:
+                if not matchers[segment.var_name](value):
+                    return None
+                decomp[segment.var_name] = value
+            elif bound != value:
+                return None
+        return decomp
+
+    def construct(self, decomp: Dict[str, str]) -> Optional[str]:
+        parts = []
+        for segment in self.segments:
+            if segment.var_name is None:
+                parts.append(segment.literal)
+                continue
+            value = decomp.get(segment.var_name)
+            if value is None:
+                return None
+            parts.append(value[::-1] if segment.is_reversed else value)
+        return "".join(parts)
+
+
+@dataclass(frozen=True)
+class LetterConstraint:
+    """An anagram (/AB) or letter-bank (B<A) term of an equation query.
+
+    /AB holds when some dictionary word is an anagram of A+B. B<A holds when
+    every letter of B also appears in A, letters of A being reusable.
+    """
+    kind: str  # "anagram" or "bank"
+    original: str
+    left: Tuple[str, ...]  # variable names and literal letters, in order
+    right: Tuple[str, ...] = ()
+    var_names: FrozenSet[str] = frozenset()
+
+    def letters(self, terms: Tuple[str, ...], decomp: Dict[str, str]) -> str:
+        return "".join(decomp[t] if t in self.var_names else t for t in terms)
+
+    def check(self, decomp: Dict[str, str], anagram_signatures) -> bool:
+        left = self.letters(self.left, decomp)
+        if self.kind == "anagram":
+            return letter_signature(left) in anagram_signatures
+        return set(left) <= set(self.letters(self.right, decomp))
+
+
+def wilson_interval(hits: int, trials: int, z: float = 1.96) -> Tuple[float, float, float]:
+    """(low, estimate, high) for a proportion; unlike the normal approximation it stays useful when hits is 0."""
+    if trials <= 0:
+        return 0.0, 0.0, 1.0
+    p = hits / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half), p, min(1.0, center + half)
+
+
+def letter_signature(letters: str) -> str:
+    """Letter-count signature: two strings are anagrams exactly when their signatures are equal."""
+    return "".join(sorted(letters))
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """A query compiled once and consumed by every solver.
+
+    Plans are cached per normalized query, so re-running a query skips parsing.
+    """
+    query: str
+    variables: Mapping[str, VariableDefinition]
+    search_patterns: Tuple[str, ...]
+    patterns: Tuple[CompiledPattern, ...]  # only filled in for equation queries
+    matchers: Mapping[str, Callable[[str], object]]
+    valid: bool = True
+    constraints: Tuple[LetterConstraint, ...] = ()
+
+    @property
+    def is_equation(self) -> bool:
+        return bool(self.variables) and bool(self.search_patterns)
+
+
+@dataclass
+class QueryRun:
+    """Outcome of one executed query, kept in the session so the next query can build on it."""
+    query: str
+    plan: Optional[QueryPlan]
+    results: Optional[List[Tuple[str, Optional[str], Dict[str, str]]]]
+    result_type: str
+    sources: List[List[str]]
+    use_substrings: bool
+    wordlists: Tuple[Tuple[str, str], ...]  # (name, fingerprint) of every list searched
+    complete: bool = True  # False when a result cap or a per-list timeout cut the results short
+    refined: bool = False  # True when answered by filtering the previous run
+    _views: Dict[Tuple[str, str], List[int]] = field(default_factory=dict, repr=False, compare=False)
+
+    def view(self, sort_order: str = "solver", filter_text: str = "") -> List[int]:
+        """Indices of the results to display, cached per sort order and row filter."""
+        needle = filter_text.strip().lower()
+        key = (sort_order, needle)
+        if key in self._views:
+            return self._views[key]
+
+        results = self.results or []
+        indices = list(range(len(results)))
+        if needle:
+            indices = [i for i in indices if needle in self._row_text(i)]
+        if sort_order == "alphabetical":
+            indices.sort(key=lambda i: (results[i][0], results[i][1] or ""))
+        elif sort_order == "length":
+            indices.sort(key=lambda i: (len(results[i][0]), results[i][0], results[i][1] or ""))
+        self._views[key] = indices
+        return indices
+
+    def page(self, page: int, page_size: int, sort_order: str = "solver", filter_text: str = "") -> Tuple[List[Tuple[str, Optional[str], Dict[str, str]]], List[List[str]], int]:
+        """One page (counted from 1) of the displayed results, their sources and the number of displayed rows."""
+        indices = self.view(sort_order, filter_text)
+        start = (page - 1) * page_size
+        selected = indices[start:start + page_size]
+        sources = [self.sources[i] for i in selected] if self.sources else []
+        return [self.results[i] for i in selected], sources, len(indices)
+
+    def _row_text(self, i: int) -> str:
+        word1, word2, decomp = self.results[i]
+        return " ".join([word1, word2 or "", *decomp.values(), *(self.sources[i] if self.sources else [])]).lower()
+
+
+@dataclass
+class QueryEstimate:
+    """Result count and runtime of a query extrapolated from a random sample of its candidates.
+
+    The bounds are 95% intervals. exact is True when every candidate was checked,
+    in which case count is the true number of results. approximate is True when a
+    QAT variable domain was too costly to build: its size was extrapolated and its
+    values drawn favouring common substrings, so the bounds only reflect sampling noise.
+    """
+    result_type: str
+    population: float  # candidates (words or variable bindings) the solver would check
+    checked: int
+    hits: int
+    count: float
+    count_low: float
+    count_high: float
+    seconds: float
+    seconds_low: float
+    seconds_high: float
+    exact: bool = False
+    approximate: bool = False
+    sample_results: List[Tuple[str, Optional[str], Dict[str, str]]] = field(default_factory=list)
+
+
+def pattern_literal_prefix(pattern: str) -> str:
+    """The literal characters every match of a pattern_to_regex pattern starts with."""
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char in ".*[#@":
+            break
+        if char == '\\' and i + 1 < len(pattern):
+            i += 1
+            char = pattern[i]
+        prefix.append(char)
+        i += 1
+    return "".join(prefix)
+
+
+def pattern_literal_count(pattern: str) -> int:
+    """How many positions of a pattern_to_regex pattern match exactly one character."""
+    count = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '[' and pattern.find(']', i) != -1:
+            i = pattern.find(']', i)
+        elif char not in ".*#@":
+            count += 1
+            if char == '\\' and i + 1 < len(pattern):
+                i += 1
+        i += 1
+    return count
+
+
+def prefix_slice(sorted_words: List[str], prefix: str) -> List[str]:
+    """The words of a sorted list that start with prefix, found by binary search."""
+    if not prefix:
+        return sorted_words
+    lo = bisect.bisect_left(sorted_words, prefix)
+    hi = bisect.bisect_left(sorted_words, prefix + "\U0010ffff", lo)
+    return sorted_words[lo:hi]
+
+
+class PackedWords(Sequence):
+    """A sorted, read-only word list kept in one bytes arena instead of a str object per word.
+
+    When every word has the same number of characters the records are fixed width
+    (Latin-1, or UTF-32 for other scripts); otherwise UTF-8 records are located
+    through an offsets array. Words are decoded on access. All three encodings sort
+    bytewise in code point order, so membership is a binary search over raw records.
+    """
+    def __init__(self, sorted_words: List[str]):
+        self._count = len(sorted_words)
+        self._width = 0
+        self._offsets = None
+        lengths = {len(word) for word in sorted_words}
+        if len(lengths) == 1:
+            try:
+                self._codec = "latin-1"
+                self._data = b"".join(word.encode("latin-1") for word in sorted_words)
+            except UnicodeEncodeError:
+                self._codec = "utf-32-be"
+                self._data = b"".join(word.encode("utf-32-be") for word in sorted_words)
+            self._width = len(self._data) // self._count
+        else:
+            self._codec = "utf-8"
+            encoded = [word.encode("utf-8") for word in sorted_words]
+            self._offsets = array.array("I", itertools.accumulate(map(len, encoded), initial=0))
+            self._data = b"".join(encoded)
+
+    def _record(self, i: int) -> bytes:
+        if self._width:
+            return self._data[i * self._width:(i + 1) * self._width]
+        return self._data[self._offsets[i]:self._offsets[i + 1]]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(j).decode(self._codec) for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("PackedWords index out of range")
+        return self._record(i).decode(self._codec)
+
+    def __iter__(self):
+        data, codec = self._data, self._codec
+        if self._width:
+            width = self._width
+            for start in range(0, len(data), width):
+                yield data[start:start + width].decode(codec)
+        else:
+            offsets = self._offsets
+            for i in range(self._count):
+                yield data[offsets[i]:offsets[i + 1]].decode(codec)
+
+    def __contains__(self, word) -> bool:
+        if not isinstance(word, str):
+            return False
+        try:
+            key = word.encode(self._codec)
+        except UnicodeEncodeError:
+            return False
+        if self._width and len(key) != self._width:
+            return False
+
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = self._record(mid)
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def nbytes(self) -> int:
+        return len(self._data) + (self._offsets.itemsize * len(self._offsets) if self._offsets is not None else 0)
+
+
+class CompactWordSet:
+    """words_set for a compact WordlistCache: membership answered by its PackedWords word_by_length buckets."""
+    def __init__(self, buckets: Mapping[int, PackedWords]):
+        self._buckets = buckets
+        self._size = sum(len(bucket) for bucket in buckets.values())
+
+    def __contains__(self, word) -> bool:
+        if not isinstance(word, str):
+            return False
+        bucket = self._buckets.get(len(word))
+        return bucket is not None and word in bucket
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        for length in sorted(self._buckets):
+            yield from self._buckets[length]
+
+    def nbytes(self) -> int:
+        return sum(bucket.nbytes() for bucket in self._buckets.values())
+
+
+@dataclass
+class IndexStatus:
+    name: str
+    state: str = "pending"  # pending, building, ready or failed
+    progress: float = 0.0
+    error: Optional[str] = None
+
+
+class IndexBuilder:
+    """Builds a wordlist's optional indexes one by one on a background thread.
+
+    Until an index reports ready, get() returns None and callers fall back to
+    their plain scan paths, so queries can run as soon as the wordlist loads.
+    """
     def __init__(self):
+        self._pending = []
+        self._indexes = {}
+        self._status: Dict[str, IndexStatus] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = False
+
+    def register(self, name: str, build_fn):
+        """build_fn(report_progress) returns the finished index.
+
+        Builders registered after start() are queued behind the running ones.
+        """
+        with self._lock:
+            self._pending.append((name, build_fn))
+            self._status[name] = IndexStatus(name=name)
+        if self._started:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            self._started = True
+            if self._pending and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="wordlist-index-builder", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                name, build_fn = self._pending.pop(0)
+            status = self._status[name]
+            status.state = "building"
+
+            def report_progress(fraction: float, status=status):
+                status.progress = min(max(fraction, 0.0), 1.0)
+
+            try:
+                index = build_fn(report_progress)
+            except Exception as e:
+                status.state = "failed"
+                status.error = str(e)
+                continue
+            with self._lock:
+                self._indexes[name] = index
+            status.progress = 1.0
+            status.state = "ready"
+
+    def get(self, name: str):
+        with self._lock:
+            return self._indexes.get(name)
+
+    def is_ready(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def statuses(self) -> List[IndexStatus]:
+        return list(self._status.values())
+
+    def all_ready(self) -> bool:
+        return all(status.state in ("ready", "failed") for status in self._status.values())
+
+
+class DomainCache:
+    """Persistent cache of QAT variable domains shared by every session on the server.
+
+    Each domain is a sorted, newline-separated array in its own file. A hit reads
+    and splits the file into a fresh list, since every solver consumes domains as
+    Python strings; what the cache saves is rescanning the wordlist. Files are
+    evicted least recently used first once the directory grows past max_bytes.
+    """
+    SUFFIX = ".dom"
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        # Set in a process that writes into a cache owned by another (an isolated
+        # query); put then only writes the file and reports its key here, and the
+        # owning process accounts for it with adopt
+        self.on_write: Optional[Callable[[str], None]] = None
+        os.makedirs(directory, exist_ok=True)
+
+        existing = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith(self.SUFFIX)]
+        for entry in sorted(existing, key=lambda e: e.stat().st_mtime):
+            self._entries[entry.name] = entry.stat().st_size
+        self._total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def make_key(fingerprint: str, pattern: str, min_len: int, max_len: int, use_substrings: bool) -> str:
+        raw = "\0".join([fingerprint, pattern, str(min_len), str(max_len), "substrings" if use_substrings else "words"])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        file_name = key + self.SUFFIX
+        path = os.path.join(self.directory, file_name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            values = data.decode('utf-8').split('\n') if data else []
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(file_name, 0)
+            return None
+        except OSError:
+            return None
+
+        with self._lock:
+            if file_name in self._entries:
+                self._entries.move_to_end(file_name)
+        return values
+
+    def put(self, key: str, values: List[str]):
+        data = "\n".join(sorted(values)).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+
+        file_name = key + self.SUFFIX
+        path = os.path.join(self.directory, file_name)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        if self.on_write is not None:
+            self.on_write(key)
+            return
+        self._record(file_name, len(data))
+
+    def adopt(self, key: str):
+        """Account for a domain file another process wrote with put."""
+        file_name = key + self.SUFFIX
+        try:
+            size = os.path.getsize(os.path.join(self.directory, file_name))
+        except OSError:
+            return
+        self._record(file_name, size)
+
+    def _record(self, file_name: str, size: int):
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(file_name, 0)
+            self._entries[file_name] = size
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            file_name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                pass
+
+
+class WordlistCache:
+    def __init__(self, compact_membership: bool = False):
         self.wordlist = []
         self.word_by_length = defaultdict(list)
         self.words_set = set()
+        self.indexes = IndexBuilder()
         self.name = ""
+        self.fingerprint = ""
+        self.compact_membership = compact_membership
 
     def load_wordlist(self, file_path):
         self.name = os.path.basename(file_path)
         self.wordlist = []
         self.word_by_length = defaultdict(list)
         self.words_set = set()
+        self.indexes = IndexBuilder()
+        self.fingerprint = ""
 
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -63,7 +657,13 @@ class WordlistCache:
                     if word and word.isalpha():
                         self.wordlist.append(word)
                         self.word_by_length[len(word)].append(word)
-                        self.words_set.add(word)
+                        if not self.compact_membership:
+                            self.words_set.add(word)
+            file_hash = hashlib.blake2b(digest_size=16)
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    file_hash.update(chunk)
+            self.fingerprint = file_hash.hexdigest()
         except FileNotFoundError:
              st.error(f"Error: Wordlist file not found at {file_path}")
              return 0
@@ -75,99 +675,69 @@ class WordlistCache:
         self.wordlist.sort()
         for length in self.word_by_length:
             self.word_by_length[length].sort()
+        if self.compact_membership:
+            # Replace every copy of the vocabulary with packed arenas; the str lists are dropped here
+            self.word_by_length = {length: PackedWords(words) for length, words in self.word_by_length.items()}
+            self.wordlist = PackedWords(self.wordlist)
+            self.words_set = CompactWordSet(self.word_by_length)
+        else:
+            # Both indexes hold a str per word, which compact mode exists to avoid
+            self.indexes.register("anagram", self._build_anagram_index)
+            self.indexes.register("split", self._build_split_index)
+        self.indexes.start()
 
         return len(self.wordlist)
 
-word_cache = WordlistCache()
-
-st.sidebar.title("Word Pattern Matcher")
-st.sidebar.header("Load Wordlist")
-
-script_dir = os.path.dirname(__file__) if "__file__" in locals() else os.getcwd()
-default_wordlist_path = os.path.join(script_dir, "default_wordlist.txt")
-broda_wordlist_path = os.path.join(script_dir, "broda_wordlist.txt")
-broda_exists = os.path.exists(broda_wordlist_path)
-    
-options = ["Upload custom wordlist", "Use default wordlist"]
-if broda_exists:
-    options.append("Use Broda wordlist")
-
-wordlist_option = st.sidebar.radio(
-    "Select wordlist",
-    options
-)
-
-loaded_wordlist_path = None
-if wordlist_option == "Upload custom wordlist":
-    uploaded_file = st.sidebar.file_uploader("Upload your wordlist (.txt)", type=["txt"])
-    if uploaded_file is not None:
-        temp_path = os.path.join(script_dir, "temp_uploaded_wordlist.txt")
-        try:
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            loaded_wordlist_path = temp_path
-        except Exception as e:
-            st.sidebar.error(f"Failed to save uploaded file: {e}")
-    else:
-        st.sidebar.info("Please upload a wordlist file (.txt)")
-
-elif wordlist_option == "Use default wordlist":
-    if not os.path.exists(default_wordlist_path):
-        try:
-            with open(default_wordlist_path, "w") as f:
-                for word in ["landform", "linoleum", "loom", "logjam", "lipbalm",
-                                 ]:
-                     f.write(word + "\n")
-            st.sidebar.info("Created default wordlist.")
-        except Exception as e:
-            st.sidebar.error(f"Failed to create default wordlist: {e}")
-    loaded_wordlist_path = default_wordlist_path
-
-elif wordlist_option == "Use Broda wordlist":
-    if broda_exists:
-        loaded_wordlist_path = broda_wordlist_path
-    else:
-        st.sidebar.error("Broda wordlist selected but not found.")
-
-if loaded_wordlist_path and word_cache.name != os.path.basename(loaded_wordlist_path):
-    st.sidebar.info(f"Loading {os.path.basename(loaded_wordlist_path)}...")
-    word_count = word_cache.load_wordlist(loaded_wordlist_path)
-    if word_count > 0:
-        st.sidebar.success(f"Loaded {word_count} words from {os.path.basename(loaded_wordlist_path)}")
-    else:
-        st.sidebar.error("Failed to load wordlist or wordlist is empty.")
-    if wordlist_option == "Upload custom wordlist" and os.path.exists(loaded_wordlist_path):
-          try:
-              os.remove(loaded_wordlist_path)
-          except Exception as e:
-              st.sidebar.warning(f"Could not remove temporary file {loaded_wordlist_path}: {e}")
-
-elif not word_cache.wordlist and 'first_run_done' not in st.session_state:
-      st.sidebar.warning("No wordlist loaded. Please select or upload one.")
-      st.session_state['first_run_done'] = True
-
-
-with st.sidebar.expander("Advanced Options"):
-
-    use_threading = False
-    max_results = st.number_input("Maximum results to display", min_value=10, max_value=10000, value=1000)
-    timeout_seconds = st.number_input("Query timeout (seconds)", min_value=5, max_value=2000, value=120)
-    use_substrings = st.checkbox("Allow variable values to be any substring (QAT mode)", value=True, help="If checked, variables can be any substring matching the pattern/length, not just dictionary words. Required for QAT-style queries.")
-
-st.title("Word Pattern Matcher")
-st.write("""
-Search wordlists using patterns and variable equations.
-""")
-
+    def matcher(self, **kwargs) -> "PatternMatcher":
+        """A PatternMatcher over this wordlist, its indexes and fingerprint; kwargs go to PatternMatcher."""
+        return PatternMatcher(
+            self.wordlist,
+            self.words_set,
+            self.word_by_length,
+            indexes=self.indexes,
+            wordlist_fingerprint=self.fingerprint,
+            **kwargs
+        )
 
-query_input = st.text_area("Enter your query pattern",
-                           height=150)
+    def _build_anagram_index(self, report_progress) -> Dict[str, List[str]]:
+        index = defaultdict(list)
+        total = len(self.wordlist) or 1
+        for i, word in enumerate(self.wordlist):
+            index[letter_signature(word)].append(word)
+            if i % 10000 == 0:
+                report_progress(i / total)
+        return dict(index)
+
+    def _build_split_index(self, report_progress) -> Dict[Tuple[int, int], List[str]]:
+        """Every word that splits into a dictionary-word prefix and suffix, keyed by the two lengths.
+
+        A word with several such splits is listed under each of them.
+        """
+        index = defaultdict(list)
+        total = len(self.wordlist) or 1
+        for i, word in enumerate(self.wordlist):
+            for m in range(1, len(word)):
+                if word[:m] in self.words_set and word[m:] in self.words_set:
+                    index[(m, len(word) - m)].append(word)
+            if i % 10000 == 0:
+                report_progress(i / total)
+        return dict(index)
 
 class PatternMatcher:
-    def __init__(self, wordlist: List[str], words_set: Set[str], word_by_length: Dict[int, List[str]], use_threading: bool = True, timeout: int = 60, use_substrings: bool = True):
+    def __init__(self, wordlist: List[str], words_set: Set[str], word_by_length: Dict[int, List[str]], use_threading: bool = True, timeout: int = 60, use_substrings: bool = True, indexes: Optional[IndexBuilder] = None, domain_cache: Optional[DomainCache] = None, wordlist_fingerprint: str = "", plan: Optional[QueryPlan] = None):
         self.wordlist = wordlist
         self.words_set = words_set
         self.word_by_length = word_by_length
+        self.indexes = indexes
+        self.domain_cache = domain_cache
+        self.wordlist_fingerprint = wordlist_fingerprint
+        self.truncated = False
+        self.refined = False
+        self.result_type = ""  # set by stream_query
+        # A plan passed in was compiled by the caller, whose messages have been shown already
+        self.plan: Optional[QueryPlan] = plan
+        self.estimate: Optional[QueryEstimate] = None
+        self._signature_set = None
         self.timeout = timeout
         self.start_time = time.time()
         self._regex_cache = {}
@@ -177,6 +747,10 @@ class PatternMatcher:
         self.max_workers = min(32, (os.cpu_count() or 1) + 4)
         self.use_substrings = use_substrings
 
+    def _index(self, name: str):
+        """A background-built index if it is ready, otherwise None."""
+        return self.indexes.get(name) if self.indexes is not None else None
+
     def _time_check(self):
         if time.time() - self.start_time > self.timeout:
             raise TimeoutError(f"Query exceeded timeout of {self.timeout} seconds.")
@@ -264,44 +838,46 @@ class PatternMatcher:
         )
 
     def parse_pattern_structure(self, pattern: str, variables: Dict[str, VariableDefinition]) -> Optional[PatternStructure]:
-        structure = []
-        pos = 0
+        compiled = self.compile_pattern(pattern, variables)
+        return compiled.structure if compiled else None
+
+    def compile_pattern(self, pattern: str, variables: Dict[str, VariableDefinition]) -> Optional[CompiledPattern]:
+        self._time_check()
+        segments = []
         total_length = 0
         var_refs = []
         literals = []
 
-        while pos < len(pattern):
-            self._time_check()
-            var_match = re.match(r'(~?)([A-R])', pattern[pos:])
-            if var_match:
-                reverse_flag, var_name = var_match.groups()
+        for token in re.finditer(r'(~?)([A-R])|(.)', pattern, re.DOTALL):
+            reverse_flag, var_name, literal_char = token.groups()
+            if var_name:
                 is_reversed = (reverse_flag == '~')
-                
+
                 if var_name not in variables:
                     st.error(f"Variable '{var_name}' used in pattern '{pattern}' but not defined.")
                     return None
-                    
+
                 var_info = variables[var_name]
                 if not var_info.is_fixed_length:
                     st.warning(f"Variable '{var_name}' must have fixed length for pattern matching.")
                     return None
-                    
+
                 var_refs.append((var_name, is_reversed))
+                segments.append(PatternSegment(total_length, var_info.min_len, var_name=var_name, is_reversed=is_reversed))
                 total_length += var_info.min_len
-                pos += len(reverse_flag) + len(var_name)
             else:
-                literal_char = pattern[pos]
                 literals.append(literal_char)
+                segments.append(PatternSegment(total_length, 1, literal=literal_char))
                 total_length += 1
-                pos += 1
 
-        return PatternStructure(
+        structure = PatternStructure(
             type=self._determine_pattern_type(pattern, var_refs),
             variables=var_refs,
             literals=literals,
             total_length=total_length,
             original=pattern
         )
+        return CompiledPattern(structure=structure, segments=tuple(segments))
 
     def _determine_pattern_type(self, pattern: str, var_refs: List[Tuple[str, bool]]) -> PatternType:
         if pattern.startswith('/'):
@@ -321,18 +897,12 @@ class PatternMatcher:
             st.warning("Equation solver requires both variables and patterns.")
             return []
 
-        # Parse all patterns into structures
-        pattern_structures = []
-        for pattern in patterns:
-            structure = self.parse_pattern_structure(pattern, variables)
-            if structure:
-                pattern_structures.append(structure)
-            else:
-                return []
+        plan = self.compile_plan(variables, patterns)
+        if not plan.valid:
+            return []
 
         # Start with the first pattern
-        first_structure = pattern_structures[0]
-        first_matches = self._find_matches_for_structure(first_structure, variables)
+        first_matches = self._find_matches_for_structure(plan.patterns[0], plan)
 
         # For each match of the first pattern, check if it satisfies all other patterns
         for word, decomp in first_matches:
@@ -340,72 +910,143 @@ class PatternMatcher:
             all_patterns_match = True
             other_words = []
 
-            for structure in pattern_structures[1:]:
-                constructed_word = self._construct_word_from_structure(structure, decomp)
+            for compiled in plan.patterns[1:]:
+                constructed_word = compiled.construct(decomp)
                 if not constructed_word or constructed_word not in self.words_set:
                     all_patterns_match = False
                     break
                 other_words.append(constructed_word)
 
-            if all_patterns_match:
+            if all_patterns_match and self._satisfies_constraints(plan, decomp):
                 results.append((word, other_words[0] if other_words else None, decomp))
 
         return results
 
-    def _find_matches_for_structure(self, structure: PatternStructure, variables: Dict[str, VariableDefinition]) -> List[Tuple[str, Dict[str, str]]]:
+    def _find_matches_for_structure(self, compiled: CompiledPattern, plan: QueryPlan) -> List[Tuple[str, Dict[str, str]]]:
         matches = []
-        candidate_words = self.word_by_length.get(structure.total_length, [])
-
-        for word in candidate_words:
+        for word in self.word_by_length.get(compiled.total_length, []):
             self._time_check()
-            current_pos = 0
-            decomp = {}
-            possible = True
-
-            for var_name, is_reversed in structure.variables:
-                var_info = variables[var_name]
-                var_len = var_info.min_len
-                part = word[current_pos : current_pos + var_len]
-                part_to_check = part[::-1] if is_reversed else part
-
-                if not self.matches_pattern(part_to_check, var_info.pattern, length_constraint=(var_len, var_len)):
-                    possible = False
-                    break
-
-                decomp[var_name] = part_to_check
-                current_pos += var_len
-
-            for literal in structure.literals:
-                if current_pos >= len(word) or word[current_pos] != literal:
-                    possible = False
-                    break
-                current_pos += 1
-
-            if possible and current_pos == len(word):
+            decomp = compiled.decompose(word, plan.matchers)
+            if decomp is not None:
                 matches.append((word, decomp))
-
         return matches
 
-    def _construct_word_from_structure(self, structure: PatternStructure, decomp: Dict[str, str]) -> Optional[str]:
-        try:
-            word = ""
-            for var_name, is_reversed in structure.variables:
-                if var_name not in decomp:
-                    return None
-                val = decomp[var_name]
-                word += val[::-1] if is_reversed else val
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return ";".join(p.strip() for p in query.strip().split(';') if p.strip())
+
+    def compile_query(self, query: str) -> QueryPlan:
+        """Compile a query into a QueryPlan, reusing the cached plan for the same normalized query."""
+        key = self.normalize_query(query)
+        if self.plan is not None and self.plan.query == key:
+            return self.plan
+        with _plan_cache_lock:
+            plan = _plan_cache.get(key)
+            if plan is not None:
+                _plan_cache.move_to_end(key)
+                return plan
+
+        variables, search_patterns = self.split_query(key)
+        plan = self.compile_plan(variables, search_patterns, key)
+        definitions = sum(1 for part in key.split(';') if self._is_variable_definition(part))
+        if plan.valid and len(variables) == definitions:
+            # Invalid plans and plans that skipped a definition are re-parsed
+            # each time so their errors and warnings are shown again
+            with _plan_cache_lock:
+                _plan_cache[key] = plan
+                while len(_plan_cache) > PLAN_CACHE_SIZE:
+                    _plan_cache.popitem(last=False)
+        return plan
+
+    def compile_plan(self, variables: Dict[str, VariableDefinition], search_patterns: List[str], query: str = "") -> QueryPlan:
+        valid = True
+        matchers = {}
+        for name, var in variables.items():
+            if var.pattern == '*':
+                matchers[name] = bool
+                continue
+            try:
+                matchers[name] = re.compile(self.pattern_to_regex(var.pattern)).match
+            except re.error as e:
+                st.error(f"Invalid pattern for variable {var.name}: {e}")
+                valid = False
+
+        compiled_patterns = []
+        constraints = []
+        if variables and search_patterns:
+            for pattern in search_patterns:
+                if pattern.startswith('/') or '<' in pattern:
+                    constraint = self.compile_constraint(pattern, variables)
+                    if constraint is None:
+                        valid = False
+                        break
+                    constraints.append(constraint)
+                    continue
+                compiled = self.compile_pattern(pattern, variables)
+                if compiled is None:
+                    valid = False
+                    break
+                compiled_patterns.append(compiled)
+
+            bound = {name for compiled in compiled_patterns for name, _ in compiled.variables}
+            for constraint in constraints if valid else []:
+                if not constraint.var_names <= bound:
+                    unbound = ", ".join(sorted(constraint.var_names - bound))
+                    st.error(f"'{constraint.original}' uses {unbound}, which no pattern in the query binds.")
+                    valid = False
+
+        return QueryPlan(
+            query=query,
+            variables=MappingProxyType(dict(variables)),
+            search_patterns=tuple(search_patterns),
+            patterns=tuple(compiled_patterns),
+            matchers=MappingProxyType(matchers),
+            valid=valid,
+            constraints=tuple(constraints)
+        )
 
-            for literal in structure.literals:
-                word += literal
+    def compile_constraint(self, pattern: str, variables: Dict[str, VariableDefinition]) -> Optional[LetterConstraint]:
+        """Parse an anagram term (/A, /Abc) or a letter-bank term (B<A) of an equation query."""
+        if pattern.startswith('/'):
+            kind, sides = "anagram", [pattern[1:]]
+        else:
+            kind, sides = "bank", pattern.split('<', 1)
+
+        parsed = []
+        var_names = set()
+        for side in sides:
+            terms = []
+            for char in side:
+                if 'A' <= char <= 'R':
+                    if char not in variables:
+                        st.error(f"Variable '{char}' used in pattern '{pattern}' but not defined.")
+                        return None
+                    var_names.add(char)
+                    terms.append(char)
+                elif char.isalpha() and char.islower():
+                    terms.append(char)
+                else:
+                    st.error(f"Only variables and lowercase letters are allowed in '{pattern}'.")
+                    return None
+            if not terms:
+                st.error(f"Empty side in '{pattern}'.")
+                return None
+            parsed.append(tuple(terms))
+
+        return LetterConstraint(
+            kind=kind,
+            original=pattern,
+            left=parsed[0],
+            right=parsed[1] if len(parsed) > 1 else (),
+            var_names=frozenset(var_names)
+        )
 
-            return word
-        except Exception as e:
-            st.error(f"Error constructing word: {e}")
-            return None
+    @staticmethod
+    def _is_variable_definition(part: str) -> bool:
+        return '=' in part and part[0].isalpha() and part[0].isupper() and part[0] <= 'R'
 
-    def execute_query(self, query: str) -> Tuple[Optional[List[Tuple[str, Optional[str], Dict[str, str]]]], str]:
-        self.start_time = time.time()
-        self._regex_cache = {}
+    def split_query(self, query: str) -> Tuple[Dict[str, VariableDefinition], List[str]]:
+        """Split a query into its parsed variable definitions and its search patterns."""
         raw_parts = query.strip().split(';')
         parts = [p.strip() for p in raw_parts if p.strip()]
 
@@ -415,7 +1056,7 @@ class PatternMatcher:
 
         # Parse variable definitions and search patterns
         for part in parts:
-            if '=' in part and part[0].isalpha() and part[0].isupper() and part[0] <= 'R':
+            if self._is_variable_definition(part):
                 variable_defs_raw.append(part)
             else:
                 search_patterns_raw.append(part)
@@ -429,27 +1070,383 @@ class PatternMatcher:
             else:
                 st.warning(f"Skipping invalid variable definition: {v_def_str}")
 
-        is_equation_query = bool(variables) and bool(search_patterns_raw)
+        return variables, search_patterns_raw
+
+    def estimate_query_cost(self, query: str, sample_size: int = 500) -> float:
+        """Rough number of candidate checks a query needs, used for admission control."""
+        plan = self.compile_query(query)
+        patterns = plan.search_patterns
+        if plan.is_equation and plan.patterns and (len(plan.patterns) == 1 or not self.use_substrings):
+            # Word-bound solvers only check the words the split index lists, when it applies
+            compiled = plan.patterns[0] if len(plan.patterns) == 1 else self._composite_driver(plan)
+            candidates = self._split_candidates(compiled)
+            if candidates is not None:
+                return float(len(candidates) * len(plan.patterns))
+        if plan.is_equation and len(plan.patterns) > 1 and self.use_substrings:
+            driver = self._substring_driver(plan)
+            if driver is not None:
+                return float(len(self.word_by_length.get(driver.total_length, [])) * len(plan.patterns))
+            # The QAT composite solver walks the full product of variable domains
+            cost = 1.0
+            for var in plan.variables.values():
+                cost *= max(1.0, self._estimate_domain_size(var, sample_size))
+            return cost
+        return float(len(self.wordlist) * max(1, len(patterns)))
+
+    def _estimate_domain_size(self, var: VariableDefinition, sample_size: int = 500) -> float:
+        """Extrapolate how many distinct values _all_possible_variable_values(var) holds from an evenly spaced sample."""
+        total = 0.0
+        for length in range(var.min_len, var.max_len + 1):
+            self._time_check()
+            population = self.wordlist if self.use_substrings else self.word_by_length.get(length, [])
+            if not population:
+                continue
+            sample = population[::max(1, len(population) // sample_size)]
+
+            if self.use_substrings:
+                # The domain holds distinct substrings, so count repeats in the sample once
+                seen = Counter(
+                    w[i:i+length]
+                    for w in sample
+                    for i in range(len(w) - length + 1)
+                    if self.matches_pattern(w[i:i+length], var.pattern, length_constraint=(length, length))
+                )
+                if not seen:
+                    continue
+                distinct = len(seen)
+                occurrences = sum(seen.values())
+                singletons = sum(1 for n in seen.values() if n == 1)
+                # Scaling by the sampling rate is right when nearly every value is new;
+                # once values repeat, the Good-Turing coverage 1 - singletons/occurrences
+                # says how much of the domain the sample has already seen (a handful of
+                # repeats is too few to tell)
+                estimate = distinct * len(population) / len(sample)
+                if occurrences - singletons >= 10:
+                    estimate = min(estimate, distinct / (1 - singletons / occurrences))
+                free = max(0, length - pattern_literal_count(var.pattern))
+                total += min(estimate, 26.0 ** free)
+            else:
+                hits = sum(1 for w in sample if self.matches_pattern(w, var.pattern, length_constraint=(length, length)))
+                total += hits * len(population) / len(sample)
+        return total
+
+    def estimate_query(self, query: str, time_budget: float = ESTIMATE_TIME_BUDGET, sample_matches: int = 0, seed: Optional[int] = None) -> QueryEstimate:
+        """Estimate a query's result count and runtime without solving it.
+
+        A random sample of the candidates the solver would walk is put through the
+        solver's own checks. time_budget bounds the whole estimate, including any
+        domains built on the way. Matches found along the way are real results; up
+        to sample_matches of them are returned.
+        """
+        self.start_time = time.time()
+        deadline = time.perf_counter() + time_budget
+        plan = self.plan = self.compile_query(query)
+        build_deadline = time.perf_counter() + time_budget * ESTIMATE_DOMAIN_BUILD_SHARE
+        result_type, population, buckets, draw, check, setup_seconds, approximate = self._estimate_population(plan, build_deadline)
+        if population <= 0:
+            return QueryEstimate(result_type, 0.0, 0, 0, 0.0, 0.0, 0.0, setup_seconds, setup_seconds, setup_seconds, exact=True)
+
+        rng = random.Random(seed)
+        if buckets is not None and population <= ESTIMATE_MAX_SAMPLES:
+            # Small enough to check everything; shuffled so running out of time still leaves a fair sample
+            candidates = list(itertools.chain.from_iterable(buckets))
+            rng.shuffle(candidates)
+        else:
+            candidates = (draw(rng) for _ in range(ESTIMATE_MAX_SAMPLES))
+
+        durations = []
+        hits = 0
+        samples = {}
+        for candidate in candidates:
+            started = time.perf_counter()
+            result = check(candidate)
+            finished = time.perf_counter()
+            durations.append(finished - started)
+            if result is not None:
+                hits += 1
+                if len(samples) < sample_matches:
+                    samples.setdefault((result[0], result[1], tuple(sorted(result[2].items()))), result)
+            if finished > deadline:
+                break
+
+        checked = len(durations)
+        exact = buckets is not None and checked == population
+        if exact:
+            p_low = p = p_high = hits / checked
+            count = count_low = count_high = float(hits)
+        else:
+            p_low, p, p_high = wilson_interval(hits, checked)
+            count, count_low, count_high = p * population, p_low * population, p_high * population
+
+        def walked(rate):
+            # The domain product walk stops at COMPOSITE_RESULT_CAP results; word scans check every candidate
+            if buckets is None and rate > 0:
+                return min(population, COMPOSITE_RESULT_CAP / rate)
+            return population
+
+        mean = sum(durations) / checked
+        spread = math.sqrt(sum((d - mean) ** 2 for d in durations) / max(1, checked - 1))
+        margin = 1.96 * spread / math.sqrt(checked)
+        return QueryEstimate(
+            result_type=result_type,
+            population=float(population),
+            checked=checked,
+            hits=hits,
+            count=count,
+            count_low=count_low,
+            count_high=count_high,
+            seconds=setup_seconds + walked(p) * mean,
+            seconds_low=setup_seconds + walked(p_high) * max(0.0, mean - margin),
+            seconds_high=setup_seconds + walked(p_low) * (mean + margin),
+            exact=exact,
+            approximate=approximate,
+            sample_results=list(samples.values())
+        )
+
+    def _estimate_population(self, plan: QueryPlan, build_deadline: float):
+        """Describe what plan's solver walks as (result_type, population, buckets, draw, check, setup_seconds, approximate).
+
+        buckets lists the candidate words when the solver scans words; otherwise it is
+        None and draw(rng) samples one variable binding of the QAT domain product.
+        check(candidate) runs the solver's tests and returns the result or None.
+        setup_seconds covers work done once before the walk, like building domains.
+        QAT domains not built by build_deadline (a time.perf_counter() value) are only
+        estimated, not sampled exactly, and approximate is set.
+        """
+        if not plan.is_equation:
+            return self._estimate_word_scan(list(plan.search_patterns))
+        if not plan.valid or not plan.patterns:
+            return "equation", 0.0, [], None, None, 0.0, False
+
+        if len(plan.patterns) == 1 or not self.use_substrings:
+            # Variables are bound to dictionary words, as in _optimize_pattern_matching
+            compiled = plan.patterns[0] if len(plan.patterns) == 1 else self._composite_driver(plan)
+            others = [c for c in plan.patterns if c is not compiled]
+            reverse = len(plan.patterns) == 1 and compiled.has_reversed
+            membership = {
+                name: (lambda value, matcher=matcher: bool(matcher(value)) and value in self.words_set)
+                for name, matcher in plan.matchers.items()
+            }
+            candidates = self._split_candidates(compiled)
+            buckets = [candidates if candidates is not None else self.word_by_length.get(compiled.total_length, [])]
+
+            def check(word):
+                decomp = compiled.decompose(word, membership)
+                if decomp is None or not self._satisfies_constraints(plan, decomp):
+                    return None
+                if any(other.construct(decomp) not in self.words_set for other in others):
+                    return None
+                if reverse:
+                    reversed_word = compiled.construct(decomp)
+                    return (word, reversed_word, decomp) if reversed_word in self.words_set else None
+                return word, None, decomp
+
+            return "equation", sum(map(len, buckets)), buckets, self._bucket_draw(buckets), check, 0.0, False
+
+        driver = self._substring_driver(plan)
+        if driver is not None:
+            buckets = [self.word_by_length.get(driver.total_length, [])]
+
+            def check(word):
+                decomp = driver.decompose(word, plan.matchers)
+                return self._qat_result(plan, decomp) if decomp is not None else None
+
+            return "equation", len(buckets[0]), buckets, self._bucket_draw(buckets), check, 0.0, False
+
+        var_names = sorted(plan.variables)
+        population = 1.0
+        setup_seconds = 0.0
+        approximate = False
+        samplers = []
+        domains = {}
+        for name in var_names:
+            var = plan.variables[name]
+            key = (var.pattern, var.min_len, var.max_len)
+            if key not in domains:
+                domains[key] = self._domain_sampler(var, build_deadline)
+            size, sampler, build_seconds, exact = domains[key]
+            population *= size
+            setup_seconds += build_seconds
+            approximate = approximate or not exact
+            samplers.append(sampler)
+
+        def draw(rng):
+            values = [sampler(rng) for sampler in samplers]
+            return None if None in values else dict(zip(var_names, values))
+
+        def check(decomp):
+            return self._qat_result(plan, decomp) if decomp is not None else None
+
+        return "equation", population, None, draw, check, setup_seconds, approximate
+
+    def _estimate_word_scan(self, patterns: List[str]):
+        """_estimate_population for queries without variables: a scan of the words every pattern allows."""
+        if not patterns:
+            return "definition_only", 0.0, [], None, None, 0.0, False
+        if len(patterns) > 1:
+            result_type = "intersection"
+        else:
+            result_type = "anagram" if patterns[0].startswith('/') else "simple"
+
+        lengths = None
+        predicates = []
+        for pattern in patterns:
+            pattern_lengths, predicate = self._word_predicate(pattern)
+            predicates.append(predicate)
+            if pattern_lengths is not None:
+                lengths = pattern_lengths if lengths is None else lengths & pattern_lengths
+        buckets = [words for length, words in sorted(self.word_by_length.items()) if lengths is None or length in lengths]
+
+        def check(word):
+            return (word, None, {}) if all(predicate(word) for predicate in predicates) else None
+
+        return result_type, sum(map(len, buckets)), buckets, self._bucket_draw(buckets), check, 0.0, False
+
+    def _word_predicate(self, pattern: str) -> Tuple[Optional[Set[int]], Callable[[str], bool]]:
+        """The word lengths a simple or anagram pattern allows (None for any) and a test for one word."""
+        if pattern.startswith('/'):
+            content = pattern[1:]
+            base_counts = Counter(c for c in content if c.isalpha())
+            min_len = sum(base_counts.values()) + content.count('.')
+            if '*' in content:
+                lengths = {length for length in self.word_by_length if length >= min_len}
+            else:
+                lengths = {min_len}
+
+            def is_anagram(word):
+                counts = Counter(word)
+                return all(counts[char] >= count for char, count in base_counts.items())
+
+            return lengths, is_anagram
+
+        length_constraint, clean_pattern = self.length_constraint_from_pattern(pattern)
+        lengths = set(range(length_constraint[0], length_constraint[1] + 1)) if length_constraint else None
+        try:
+            match = re.compile(self.pattern_to_regex(clean_pattern)).match
+        except re.error as e:
+            st.error(f"Invalid pattern leads to regex error: {clean_pattern} -> {e}")
+            return set(), lambda word: False
+        return lengths, lambda word: match(word) is not None
+
+    @staticmethod
+    def _bucket_draw(buckets: List[List[str]]):
+        """draw(rng) picking one word uniformly from all the buckets together."""
+        ends = list(itertools.accumulate(len(bucket) for bucket in buckets))
+
+        def draw(rng):
+            i = rng.randrange(ends[-1])
+            b = bisect.bisect_right(ends, i)
+            return buckets[b][i - (ends[b - 1] if b else 0)]
+
+        return draw
+
+    def _domain_sampler(self, var: VariableDefinition, build_deadline: float):
+        """(size, sample(rng), build_seconds, exact) for a QAT variable domain.
+
+        A domain in the persistent cache, or one that can be built before build_deadline
+        (a time.perf_counter() value), is sampled exactly. Otherwise its size comes from
+        _estimate_domain_size and values are random matching substrings of random words,
+        which favours substrings that occur often, and exact is False.
+        """
+        if self.domain_cache is not None and self.wordlist_fingerprint:
+            cached = self.domain_cache.get(DomainCache.make_key(self.wordlist_fingerprint, var.pattern, var.min_len, var.max_len, self.use_substrings))
+            if cached is not None:
+                return float(len(cached)), (lambda rng: rng.choice(cached) if cached else None), 0.0, True
+
+        if not self.wordlist:
+            return 0.0, lambda rng: None, 0.0, True
+
+        # _all_possible_variable_values tests every substring position of every word once per length
+        positions = sum(
+            len(words) * (word_length - length + 1)
+            for length in range(var.min_len, var.max_len + 1)
+            for word_length, words in self.word_by_length.items()
+            if word_length >= length
+        )
+        rng = random.Random(0)
+        probes = [rng.choice(self.wordlist)[:var.min_len] for _ in range(200)]
+        started = time.perf_counter()
+        for probe in probes:
+            self.matches_pattern(probe, var.pattern, length_constraint=(var.min_len, var.max_len))
+        build_seconds = positions * (time.perf_counter() - started) / len(probes)
+
+        if time.perf_counter() + build_seconds <= build_deadline:
+            # The guess above can be off, so the scan itself gives up at the deadline
+            started = time.perf_counter()
+            values = self._all_possible_variable_values(var, deadline=build_deadline)
+            if values is not None:
+                # With a domain cache the solver will find the domain already built
+                build_seconds = 0.0 if self.domain_cache is not None and self.wordlist_fingerprint else time.perf_counter() - started
+                return float(len(values)), (lambda rng: rng.choice(values) if values else None), build_seconds, True
+
+        size = self._estimate_domain_size(var, sample_size=200)
+        if size <= 0:
+            return 0.0, lambda rng: None, build_seconds, False
+
+        def sample(rng):
+            for _ in range(1000):
+                length = rng.randint(var.min_len, var.max_len)
+                word = rng.choice(self.wordlist)
+                if len(word) < length:
+                    continue
+                i = rng.randrange(len(word) - length + 1)
+                if self.matches_pattern(word[i:i + length], var.pattern, length_constraint=(length, length)):
+                    return word[i:i + length]
+            return None
+
+        return size, sample, build_seconds, False
+
+    def execute_query(self, query: str, previous: Optional[Tuple[QueryPlan, List[Tuple[str, Optional[str], Dict[str, str]]]]] = None, estimate: bool = False, sample_matches: int = ESTIMATE_SAMPLE_MATCHES) -> Tuple[Optional[List[Tuple[str, Optional[str], Dict[str, str]]]], str]:
+        """Run a query. previous is the plan and complete results of the last query on
+        this wordlist; when the new query only narrows it, those results are filtered
+        instead of solving again.
+
+        With estimate set, the query is only sampled: self.estimate holds the estimated
+        result count and runtime, and up to sample_matches real matches are returned."""
+        self.start_time = time.time()
+        self._regex_cache = {}
+        self.truncated = False
+        self.refined = False
+        self.estimate = None
+        plan = self.plan = self.compile_query(query)
+        search_patterns_raw = list(plan.search_patterns)
+
+        is_equation_query = plan.is_equation
         is_anagram_query = any(p.startswith('/') for p in search_patterns_raw)
 
         try:
+            if estimate:
+                self.estimate = self.estimate_query(query, sample_matches=sample_matches)
+                return self.estimate.sample_results, self.estimate.result_type
+
             if is_equation_query:
                 # Handle complex equation queries
-                if len(search_patterns_raw) > 1:
+                if not plan.valid:
+                    return [], "equation"
+                if not plan.patterns:
+                    st.warning("Anagram and letter-bank terms filter the words matched by other patterns; add at least one pattern such as AB.")
+                    return [], "equation"
+                if previous is not None and self.is_narrowing(previous[0], plan):
+                    refined = self.refine_results(previous[1], plan)
+                    if refined is not None:
+                        self.refined = True
+                        if len(plan.patterns) > 1 and len(refined) > COMPOSITE_RESULT_CAP:
+                            # A single-pattern run isn't capped, but the composite solver it stands in for is
+                            self.truncated = True
+                            refined = refined[:COMPOSITE_RESULT_CAP]
+                        return refined, "equation"
+                if len(plan.patterns) > 1:
                     # Multiple patterns with variables
-                    results = self._handle_composite_pattern(search_patterns_raw, variables)
+                    results = self._handle_composite_pattern(plan)
+                    return results, "equation"
+                elif plan.patterns[0].has_reversed:
+                    # Pattern contains reversed variables
+                    results = self._handle_reverse_pattern(plan)
                     return results, "equation"
                 else:
-                    # Single pattern with variables
-                    pattern = search_patterns_raw[0]
-                    if any('~' in var for var in re.findall(r'(~?[A-R])', pattern)):
-                        # Pattern contains reversed variables
-                        results = self._handle_reverse_pattern(pattern, variables)
-                        return results, "equation"
-                    else:
-                        # Simple pattern with variables
-                        results = self._handle_complex_pattern(pattern, variables)
-                        return results, "equation"
+                    # Simple pattern with variables
+                    results = self._handle_complex_pattern(plan)
+                    return results, "equation"
 
             elif len(search_patterns_raw) == 1:
                 pattern = search_patterns_raw[0]
@@ -495,6 +1492,9 @@ class PatternMatcher:
         except TimeoutError:
             st.error(f"Query timed out after {self.timeout} seconds.")
             return None, "timeout"
+        except MemoryError:
+            # Left to the caller, which knows the memory limit the query ran under
+            raise
         except Exception as e:
             st.error(f"An error occurred during query execution: {e}")
             import traceback
@@ -503,6 +1503,78 @@ class PatternMatcher:
 
         return [], "unknown"
 
+    def iter_query(self, query: str) -> Iterator[Tuple[str, Optional[str], Dict[str, str]]]:
+        """Yield every result of a query without the result cap, for exports.
+
+        Multi-pattern equations come straight from the composite solvers one result
+        at a time; the other query kinds are bounded by the wordlist size and come
+        from execute_query. self.truncated is set if the query timed out part way.
+        """
+        self.truncated = False
+        plan = self.plan = self.compile_query(query)
+        if not plan.valid:
+            # compile_query has already reported the errors
+            return
+        if not (plan.is_equation and len(plan.patterns) > 1):
+            results, _ = self.execute_query(query)
+            self.truncated = results is None
+            yield from results or []
+            return
+
+        self.start_time = time.time()
+        self._regex_cache = {}
+        if not self._validate_variable_constraints(plan.variables):
+            return
+        try:
+            yield from self._iter_composite_pattern(plan)
+        except TimeoutError:
+            st.error(f"Query timed out after {self.timeout} seconds.")
+            self.truncated = True
+
+    def stream_query(self, query: str, previous: Optional[Tuple[QueryPlan, List[Tuple[str, Optional[str], Dict[str, str]]]]] = None) -> Iterator[Tuple[str, Optional[str], Dict[str, str]]]:
+        """Yield the results execute_query(query, previous) returns, as soon as the solver finds them.
+
+        Equations solved by walking the QAT domain product stream out one at a time
+        and stop at COMPOSITE_RESULT_CAP. Every other query kind is bounded by the
+        wordlist or the previous results, or has to sort before capping, so it comes
+        from execute_query. Afterwards self.result_type holds execute_query's result
+        type; on "timeout" or "error" the results yielded so far should be dropped.
+        """
+        self.truncated = False
+        self.refined = False
+        plan = self.plan = self.compile_query(query)
+        streamable = (
+            plan.valid
+            and plan.is_equation
+            and len(plan.patterns) > 1
+            and not (self.use_substrings and self._substring_driver(plan) is not None)
+            and not (previous is not None and self.is_narrowing(previous[0], plan))
+        )
+        if not streamable:
+            results, self.result_type = self.execute_query(query, previous=previous)
+            yield from results or []
+            return
+
+        self.result_type = "equation"
+        self.start_time = time.time()
+        self._regex_cache = {}
+        if not self._validate_variable_constraints(plan.variables):
+            return
+        try:
+            for count, result in enumerate(self._iter_composite_pattern(plan), 1):
+                yield result
+                if count >= COMPOSITE_RESULT_CAP:
+                    self.truncated = True
+                    return
+        except TimeoutError:
+            st.error(f"Query timed out after {self.timeout} seconds.")
+            self.result_type = "timeout"
+        except MemoryError:
+            raise
+        except Exception as e:
+            st.error(f"An error occurred during query execution: {e}")
+            self.result_type = "error"
+
     def process_anagram_pattern(self, pattern_str: str) -> Optional[List[str]]:
         if not pattern_str.startswith('/'):
             return None
@@ -522,6 +1594,11 @@ class PatternMatcher:
         min_len = len(base_letters) + dots
         max_len = None if stars > 0 else len(base_letters) + dots
 
+        anagram_index = self._index("anagram")
+        if anagram_index is not None and dots == 0 and stars == 0:
+            # Exact anagram: one lookup by letter signature
+            return list(anagram_index.get(letter_signature(base_letters), []))
+
         candidate_words = []
         if max_len is not None:
             if min_len == max_len:
@@ -571,12 +1648,14 @@ class PatternMatcher:
         matches = []
         candidate_words = []
 
+        # Every list here is sorted, so a literal prefix narrows it to one contiguous slice
+        prefix = pattern_literal_prefix(clean_pattern)
         if length_constraint:
             min_len, max_len = length_constraint
             for length in range(min_len, max_len + 1):
-                candidate_words.extend(self.word_by_length.get(length, []))
+                candidate_words.extend(prefix_slice(self.word_by_length.get(length, []), prefix))
         else:
-            candidate_words = self.wordlist
+            candidate_words = prefix_slice(self.wordlist, prefix)
 
         if not candidate_words: return []
 
@@ -618,43 +1697,16 @@ class PatternMatcher:
 
         return None, pattern_str
 
-    def _parallel_process_pattern(self, pattern: str, variables: Dict[str, VariableDefinition]) -> List[Tuple[str, Dict[str, str]]]:
-        structure = self.parse_pattern_structure(pattern, variables)
-        if not structure:
-            return []
-
+    def _parallel_process_pattern(self, compiled: CompiledPattern, plan: QueryPlan) -> List[Tuple[str, Dict[str, str]]]:
         matches = []
-        candidate_words = self.word_by_length.get(structure.total_length, [])
+        candidate_words = self.word_by_length.get(compiled.total_length, [])
 
         def process_chunk(chunk: List[str]) -> List[Tuple[str, Dict[str, str]]]:
             chunk_matches = []
             for word in chunk:
-                current_pos = 0
-                decomp = {}
-                possible = True
-
-                for var_name, is_reversed in structure.variables:
-                    var_info = variables[var_name]
-                    var_len = var_info.min_len
-                    part = word[current_pos : current_pos + var_len]
-                    part_to_check = part[::-1] if is_reversed else part
-
-                    if not self.matches_pattern(part_to_check, var_info.pattern, length_constraint=(var_len, var_len)):
-                        possible = False
-                        break
-
-                    decomp[var_name] = part_to_check
-                    current_pos += var_len
-
-                for literal in structure.literals:
-                    if current_pos >= len(word) or word[current_pos] != literal:
-                        possible = False
-                        break
-                    current_pos += 1
-
-                if possible and current_pos == len(word):
+                decomp = compiled.decompose(word, plan.matchers)
+                if decomp is not None:
                     chunk_matches.append((word, decomp))
-
             return chunk_matches
 
         if self.use_threading and len(candidate_words) > 1000:
@@ -686,26 +1738,17 @@ class PatternMatcher:
 
         return True
 
-    def _optimize_pattern_order(self, patterns: List[str], variables: Dict[str, VariableDefinition]) -> List[str]:
-        # Sort patterns by complexity and length to optimize matching
-        pattern_structures = []
-        for pattern in patterns:
-            structure = self.parse_pattern_structure(pattern, variables)
-            if structure:
-                pattern_structures.append((pattern, structure))
-
+    def _optimize_pattern_order(self, plan: QueryPlan) -> List[CompiledPattern]:
         # Sort by:
         # 1. Number of variables (fewer first)
         # 2. Total length (shorter first)
         # 3. Number of literals (more first)
-        pattern_structures.sort(key=lambda x: (
-            len(x[1].variables),
-            x[1].total_length,
-            -len(x[1].literals)
+        return sorted(plan.patterns, key=lambda c: (
+            len(c.structure.variables),
+            c.structure.total_length,
+            -len(c.structure.literals)
         ))
 
-        return [p[0] for p in pattern_structures]
-
     def _format_result(self, result: Tuple[str, Optional[str], Dict[str, str]], pattern_type: str) -> str:
         word1, word2, decomp = result
         if pattern_type == "equation":
@@ -718,49 +1761,87 @@ class PatternMatcher:
         else:
             return word1
 
-    def _optimize_word_candidates(self, pattern: str, variables: Dict[str, VariableDefinition]) -> List[str]:
+    def _optimize_word_candidates(self, compiled: CompiledPattern) -> List[str]:
         """Optimize the list of candidate words based on pattern constraints."""
-        structure = self.parse_pattern_structure(pattern, variables)
-        if not structure:
-            return []
+        # Every variable in a pattern has a fixed length, so only one bucket can match
+        return self.word_by_length.get(compiled.total_length, [])
 
-        # Get all possible lengths for each variable
-        var_lengths = {}
-        for var_name, _ in structure.variables:
-            var_info = variables[var_name]
-            var_lengths[var_name] = (var_info.min_len, var_info.max_len)
-
-        # Calculate total length range
-        min_total_len = sum(min_len for min_len, _ in var_lengths.values()) + len(structure.literals)
-        max_total_len = sum(max_len for _, max_len in var_lengths.values()) + len(structure.literals)
-
-        # Get all words within the length range
-        candidates = []
-        for length in range(min_total_len, max_total_len + 1):
-            candidates.extend(self.word_by_length.get(length, []))
-
-        return candidates
-
-    def _precompute_pattern_matches(self, pattern: str, variables: Dict[str, VariableDefinition]) -> Dict[str, Set[str]]:
+    def _precompute_pattern_matches(self, compiled: CompiledPattern, plan: QueryPlan) -> Dict[str, Set[str]]:
         """Precompute matches for each variable in the pattern."""
-        structure = self.parse_pattern_structure(pattern, variables)
-        if not structure:
-            return {}
-
         matches = {}
-        for var_name, is_reversed in structure.variables:
-            var_info = variables[var_name]
+        for var_name, _ in compiled.variables:
+            if var_name in matches:
+                continue
+            var_info = plan.variables[var_name]
+            matcher = plan.matchers[var_name]
             var_matches = set()
 
             for length in range(var_info.min_len, var_info.max_len + 1):
                 for word in self.word_by_length.get(length, []):
-                    if self.matches_pattern(word, var_info.pattern, length_constraint=(length, length)):
+                    if matcher(word):
                         var_matches.add(word)
 
-            matches[var_name] = var_matches
+            matches[var_name] = set(self._prune_domain(plan, var_name, var_matches))
 
         return matches
 
+    def _anagram_signatures(self):
+        """Letter signatures of every word: the background anagram index, or a set built once per matcher."""
+        index = self._index("anagram")
+        if index is not None:
+            return index
+        if self._signature_set is None:
+            signatures = set()
+            for i, word in enumerate(self.wordlist):
+                if i % 10000 == 0:
+                    self._time_check()
+                signatures.add(letter_signature(word))
+            self._signature_set = signatures
+        return self._signature_set
+
+    def _constraint_signatures(self, constraints) -> object:
+        # Only anagram terms need the signatures, so don't build them for letter banks alone
+        return self._anagram_signatures() if any(c.kind == "anagram" for c in constraints) else ()
+
+    def _prune_domain(self, plan: QueryPlan, var_name: str, values):
+        """Drop values that fail a letter constraint on var_name alone, before any binding is tried."""
+        single = [c for c in plan.constraints if c.var_names == {var_name}]
+        if not single:
+            return values
+        signatures = self._constraint_signatures(single)
+        return [v for v in values if all(c.check({var_name: v}, signatures) for c in single)]
+
+    def _satisfies_constraints(self, plan: QueryPlan, decomp: Dict[str, str]) -> bool:
+        if not plan.constraints:
+            return True
+        signatures = self._constraint_signatures(plan.constraints)
+        return all(c.check(decomp, signatures) for c in plan.constraints)
+
+    def _bind_with_constraints(self, plan: QueryPlan, var_names: List[str], var_domains: List[List[str]]):
+        """Yield bindings in itertools.product order, checking each letter constraint as soon as
+        the last of its variables is bound so failing prefixes are never extended."""
+        checks_at = [[] for _ in var_names]
+        for constraint in plan.constraints:
+            if len(constraint.var_names) > 1:
+                checks_at[max(var_names.index(v) for v in constraint.var_names)].append(constraint)
+        signatures = self._constraint_signatures(plan.constraints)
+        decomp = {}
+
+        def bind(i):
+            if i == len(var_names):
+                yield dict(decomp)
+                return
+            name = var_names[i]
+            for value in var_domains[i]:
+                self._time_check()
+                decomp[name] = value
+                if all(c.check(decomp, signatures) for c in checks_at[i]):
+                    yield from bind(i + 1)
+            decomp.pop(name, None)
+
+        if all(c.check({}, signatures) for c in plan.constraints if not c.var_names):
+            yield from bind(0)
+
     def _validate_variable_constraints(self, variables: Dict[str, VariableDefinition]) -> bool:
         """Validate that all variable constraints are consistent."""
         # Check for overlapping variable names
@@ -785,165 +1866,796 @@ class PatternMatcher:
 
         return True
 
-    def _optimize_pattern_matching(self, pattern: str, variables: Dict[str, VariableDefinition]) -> List[Tuple[str, Dict[str, str]]]:
+    def _split_candidates(self, compiled: CompiledPattern) -> Optional[List[str]]:
+        """Words that split into two dictionary words at compiled's variable boundary,
+        or None if compiled isn't a two-variable concatenation or the split index isn't ready."""
+        lengths = compiled.split_lengths
+        if lengths is None:
+            return None
+        index = self._index("split")
+        if index is None:
+            return None
+        return index.get(lengths, [])
+
+    def _optimize_pattern_matching(self, compiled: CompiledPattern, plan: QueryPlan) -> List[Tuple[str, Dict[str, str]]]:
         """Optimize pattern matching by using precomputed matches and early filtering."""
-        structure = self.parse_pattern_structure(pattern, variables)
-        if not structure:
-            return []
+        split_words = self._split_candidates(compiled)
+        if split_words is not None:
+            # Both halves are already dictionary words, so only the variable patterns are left to check
+            matches = []
+            for i, word in enumerate(split_words):
+                if i % 1000 == 0:
+                    self._time_check()
+                decomp = compiled.decompose(word, plan.matchers)
+                if decomp is not None:
+                    matches.append((word, decomp))
+            return matches
 
         # Precompute matches for each variable
-        var_matches = self._precompute_pattern_matches(pattern, variables)
+        var_matches = self._precompute_pattern_matches(compiled, plan)
         if not var_matches:
             return []
 
         # Get optimized candidate words
-        candidates = self._optimize_word_candidates(pattern, variables)
+        candidates = self._optimize_word_candidates(compiled)
         if not candidates:
             return []
 
+        # Early filtering using precomputed matches
+        membership = {name: values.__contains__ for name, values in var_matches.items()}
         matches = []
         for word in candidates:
             self._time_check()
-            current_pos = 0
-            decomp = {}
-            possible = True
-
-            for var_name, is_reversed in structure.variables:
-                var_info = variables[var_name]
-                var_len = var_info.min_len
-                part = word[current_pos : current_pos + var_len]
-                part_to_check = part[::-1] if is_reversed else part
-
-                # Early filtering using precomputed matches
-                if part_to_check not in var_matches[var_name]:
-                    possible = False
-                    break
-
-                decomp[var_name] = part_to_check
-                current_pos += var_len
-
-            for literal in structure.literals:
-                if current_pos >= len(word) or word[current_pos] != literal:
-                    possible = False
-                    break
-                current_pos += 1
-
-            if possible and current_pos == len(word):
+            decomp = compiled.decompose(word, membership)
+            if decomp is not None:
                 matches.append((word, decomp))
 
         return matches
 
-    def _handle_complex_pattern(self, pattern: str, variables: Dict[str, VariableDefinition]) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
+    def _handle_complex_pattern(self, plan: QueryPlan) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
         """Handle patterns with multiple variables and literals using optimized matching."""
-        if not self._validate_variable_constraints(variables):
+        if not self._validate_variable_constraints(plan.variables):
             return []
 
-        matches = self._optimize_pattern_matching(pattern, variables)
-        return [(m[0], None, m[1]) for m in matches]
+        matches = self._optimize_pattern_matching(plan.patterns[0], plan)
+        return [(m[0], None, m[1]) for m in matches if self._satisfies_constraints(plan, m[1])]
 
-    def _handle_reverse_pattern(self, pattern: str, variables: Dict[str, VariableDefinition]) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
+    def _handle_reverse_pattern(self, plan: QueryPlan) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
         """Handle patterns with reversed variables using optimized matching."""
-        if not self._validate_variable_constraints(variables):
+        if not self._validate_variable_constraints(plan.variables):
             return []
 
-        matches = self._optimize_pattern_matching(pattern, variables)
+        compiled = plan.patterns[0]
+        matches = self._optimize_pattern_matching(compiled, plan)
         results = []
 
         for word, decomp in matches:
-            reversed_word = ""
-            for var_name, is_reversed in self.parse_pattern_structure(pattern, variables).variables:
-                val = decomp[var_name]
-                reversed_word += val[::-1] if is_reversed else val
-            for literal in self.parse_pattern_structure(pattern, variables).literals:
-                reversed_word += literal
-
-            if reversed_word in self.words_set:
+            reversed_word = compiled.construct(decomp)
+            if reversed_word in self.words_set and self._satisfies_constraints(plan, decomp):
                 results.append((word, reversed_word, decomp))
 
         return results
 
-    def _all_possible_variable_values(self, var: VariableDefinition) -> List[str]:
-        """Generate all possible values for a variable, matching its pattern and length constraints."""
+    def is_narrowing(self, old: Optional[QueryPlan], new: QueryPlan) -> bool:
+        """True if every answer to new is also an answer to old, so old's results can be filtered.
+
+        Variables may only tighten their length range or replace a '*' pattern, and
+        patterns may only be appended. In substring mode a single-pattern query stays
+        single, since it binds variables to dictionary words while the QAT composite
+        solver binds them to substrings; in word mode both solvers report the words of
+        one pattern, so that pattern must stay the composite driver.
+        """
+        if old is None or not old.valid or not new.valid or not old.is_equation or not new.is_equation:
+            return False
+        if set(old.variables) != set(new.variables):
+            return False
+        for name, old_var in old.variables.items():
+            new_var = new.variables[name]
+            if new_var.min_len < old_var.min_len or new_var.max_len > old_var.max_len:
+                return False
+            if old_var.pattern != '*' and new_var.pattern != old_var.pattern:
+                return False
+
+        old_patterns, new_patterns = old.search_patterns, new.search_patterns
+        if new_patterns[:len(old_patterns)] != old_patterns:
+            return False
+        if len(old.patterns) == 1 and len(new.patterns) == 1:
+            # Letter constraints may still be added to a single-pattern query
+            return True
+        if len(old.patterns) == 1 and self.use_substrings:
+            return False
+        if not self.use_substrings:
+            # The dictionary-word composite solver reports bindings of its driver pattern only
+            return self._composite_driver(old).original == self._composite_driver(new).original
+        return True
+
+    def refine_results(self, previous_results: List[Tuple[str, Optional[str], Dict[str, str]]], plan: QueryPlan) -> Optional[List[Tuple[str, Optional[str], Dict[str, str]]]]:
+        """Filter the previous query's results down to the answers of plan, or None if a binding is missing."""
+        needed = {name for compiled in plan.patterns for name, _ in compiled.variables}
+        results = []
+        for i, (word1, word2, decomp) in enumerate(previous_results):
+            if i % 1000 == 0:
+                self._time_check()
+            if not needed.issubset(decomp):
+                return None
+
+            ok = True
+            for name, value in decomp.items():
+                var = plan.variables[name]
+                if not (var.min_len <= len(value) <= var.max_len) or not plan.matchers[name](value):
+                    ok = False
+                    break
+            if not ok:
+                continue
+
+            words = []
+            for compiled in plan.patterns:
+                word = compiled.construct(decomp)
+                if word is None or word not in self.words_set:
+                    ok = False
+                    break
+                words.append(word)
+            if not ok or not self._satisfies_constraints(plan, decomp):
+                continue
+
+            if len(plan.patterns) > 1 and self.use_substrings:
+                results.append((words[0], words[1], decomp))
+            else:
+                results.append((word1, word2, decomp))
+        return results
+
+    def _composite_driver(self, plan: QueryPlan) -> CompiledPattern:
+        # The pattern with the most literals, then the longest, narrows candidates the most
+        return max(plan.patterns, key=lambda c: (len(c.structure.literals), c.total_length))
+
+    def _substring_driver(self, plan: QueryPlan) -> Optional[CompiledPattern]:
+        """A pattern without reversed variables that binds every variable, or None.
+
+        Every slice of a dictionary word is a substring, so decomposing the words of
+        such a pattern's length yields exactly the QAT bindings that satisfy it, without
+        enumerating the product of the substring domains. The pattern with the smallest
+        length bucket is preferred.
+        """
+        drivers = [
+            c for c in plan.patterns
+            if not c.has_reversed and {name for name, _ in c.variables} == set(plan.variables)
+        ]
+        if not drivers:
+            return None
+        return min(drivers, key=lambda c: len(self.word_by_length.get(c.total_length, [])))
+
+    def _drive_substring_composite(self, driver: CompiledPattern, plan: QueryPlan) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
+        """QAT composite solve that splits the driver's candidate words instead of walking the domain product.
+
+        Results come back in the same order the product walk would produce them.
+        """
+        var_names = sorted(plan.variables)
+        found = sorted(self._iter_substring_driver(driver, plan), key=lambda result: tuple(result[2][name] for name in var_names))
+        if len(found) > COMPOSITE_RESULT_CAP:
+            self.truncated = True
+            found = found[:COMPOSITE_RESULT_CAP]
+        return found
+
+    def _iter_substring_driver(self, driver: CompiledPattern, plan: QueryPlan) -> Iterator[Tuple[str, Optional[str], Dict[str, str]]]:
+        """The results of _drive_substring_composite in the driver's word order."""
+        for i, word in enumerate(self.word_by_length.get(driver.total_length, [])):
+            if i % 1000 == 0:
+                self._time_check()
+            decomp = driver.decompose(word, plan.matchers)
+            result = self._qat_result(plan, decomp) if decomp is not None else None
+            if result is not None:
+                yield result
+
+    def _qat_result(self, plan: QueryPlan, decomp: Dict[str, str]) -> Optional[Tuple[str, Optional[str], Dict[str, str]]]:
+        """The QAT composite result for a full binding, or None if a constraint or a constructed word fails."""
+        if not self._satisfies_constraints(plan, decomp):
+            return None
+        all_words = []
+        for compiled in plan.patterns:
+            constructed = compiled.construct(decomp)
+            if constructed not in self.words_set:
+                return None
+            all_words.append(constructed)
+        return all_words[0], all_words[1] if len(all_words) > 1 else None, decomp
+
+    def _all_possible_variable_values(self, var: VariableDefinition, deadline: Optional[float] = None) -> Optional[List[str]]:
+        """Generate all possible values for a variable, matching its pattern and length constraints.
+
+        With a deadline (a time.perf_counter() value) the scan gives up and returns
+        None once it passes; otherwise it runs until the query timeout.
+        """
+        cache_key = None
+        if self.domain_cache is not None and self.wordlist_fingerprint:
+            cache_key = DomainCache.make_key(self.wordlist_fingerprint, var.pattern, var.min_len, var.max_len, self.use_substrings)
+            cached = self.domain_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         results = []
         if self.use_substrings:
             for length in range(var.min_len, var.max_len + 1):
-                for w in self.wordlist:
+                for n, w in enumerate(self.wordlist):
+                    if n % 1000 == 0:
+                        self._time_check()
+                        if deadline is not None and time.perf_counter() > deadline:
+                            return None
                     if len(w) < length:
                         continue
                     for i in range(len(w) - length + 1):
                         candidate = w[i:i+length]
                         if self.matches_pattern(candidate, var.pattern, length_constraint=(length, length)):
                             results.append(candidate)
-            return list(set(results))
         else:
             for length in range(var.min_len, var.max_len + 1):
-                for word in self.word_by_length.get(length, []):
+                for n, word in enumerate(self.word_by_length.get(length, [])):
+                    if n % 1000 == 0:
+                        self._time_check()
+                        if deadline is not None and time.perf_counter() > deadline:
+                            return None
                     if self.matches_pattern(word, var.pattern, length_constraint=(length, length)):
                         results.append(word)
-            return list(set(results))
 
-    def _handle_composite_pattern(self, patterns: List[str], variables: Dict[str, VariableDefinition]) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
+        values = sorted(set(results))
+        if cache_key is not None:
+            self.domain_cache.put(cache_key, values)
+        return values
+
+    def _handle_composite_pattern(self, plan: QueryPlan) -> List[Tuple[str, Optional[str], Dict[str, str]]]:
         """QAT-style: If substring mode is enabled, always use full product. Otherwise, use optimized driver pattern."""
-        if not self._validate_variable_constraints(variables):
+        if not self._validate_variable_constraints(plan.variables):
             return []
 
         if self.use_substrings:
+            driver = self._substring_driver(plan)
+            if driver is not None:
+                return self._drive_substring_composite(driver, plan)
+
+        results = []
+        for result in self._iter_composite_pattern(plan):
+            results.append(result)
+            if len(results) >= COMPOSITE_RESULT_CAP:
+                self.truncated = True
+                break
+        return results
+
+    def _iter_composite_pattern(self, plan: QueryPlan) -> Iterator[Tuple[str, Optional[str], Dict[str, str]]]:
+        """Every result of _handle_composite_pattern, uncapped and produced one at a time."""
+        variables = plan.variables
+        if self.use_substrings:
+            driver = self._substring_driver(plan)
+            if driver is not None:
+                yield from self._iter_substring_driver(driver, plan)
+                return
+
             # QAT-style: try all possible substrings for each variable
             var_names = sorted(variables.keys())
-            var_domains = [self._all_possible_variable_values(variables[name]) for name in var_names]
+            var_domains = [self._prune_domain(plan, name, self._all_possible_variable_values(variables[name])) for name in var_names]
             if not all(var_domains):
-                return []
-            pattern_structures = [self.parse_pattern_structure(p, variables) for p in patterns]
-            if not all(pattern_structures):
-                return []
-            results = []
-            for values in itertools.product(*var_domains):
+                return
+            if plan.constraints:
+                bindings = self._bind_with_constraints(plan, var_names, var_domains)
+            else:
+                bindings = (dict(zip(var_names, values)) for values in itertools.product(*var_domains))
+            for decomp in bindings:
                 self._time_check()
-                decomp = dict(zip(var_names, values))
                 all_words = []
-                for structure in pattern_structures:
-                    word = ""
-                    for var_name, is_reversed in structure.variables:
-                        val = decomp[var_name]
-                        word += val[::-1] if is_reversed else val
-                    for literal in structure.literals:
-                        word += literal
+                for compiled in plan.patterns:
+                    word = compiled.construct(decomp)
                     if word not in self.words_set:
                         break
                     all_words.append(word)
                 else:
-                    results.append((all_words[0], all_words[1] if len(all_words) > 1 else None, decomp))
-                    if len(results) > 10000:
-                        break
-            return results
+                    yield all_words[0], all_words[1] if len(all_words) > 1 else None, decomp
         else:
             # Find the pattern with the most literals/longest length
-            pattern_structures = [self.parse_pattern_structure(p, variables) for p in patterns]
-            if not all(pattern_structures):
-                return []
-            driver_idx = max(range(len(pattern_structures)), key=lambda i: (len(pattern_structures[i].literals), pattern_structures[i].total_length))
-            driver_pattern = patterns[driver_idx]
-            driver_structure = pattern_structures[driver_idx]
-            other_patterns = [p for i,p in enumerate(patterns) if i != driver_idx]
-            other_structures = [s for i,s in enumerate(pattern_structures) if i != driver_idx]
-            matches = self._optimize_pattern_matching(driver_pattern, variables)
-            results = []
+            driver = self._composite_driver(plan)
+            others = [c for c in plan.patterns if c is not driver]
+            matches = self._optimize_pattern_matching(driver, plan)
             for word, decomp in matches:
                 self._time_check()
                 all_ok = True
-                for structure in other_structures:
-                    candidate = self._construct_word_from_structure(structure, decomp)
+                for compiled in others:
+                    candidate = compiled.construct(decomp)
                     if not candidate or candidate not in self.words_set:
                         all_ok = False
                         break
-                if all_ok:
-                    results.append((word, None, decomp))
-                    if len(results) > 10000:
-                        break
-            return results
+                if all_ok and self._satisfies_constraints(plan, decomp):
+                    yield word, None, decomp
+
+
+@st.cache_resource(show_spinner=False)
+def get_domain_cache() -> DomainCache:
+    return DomainCache(DOMAIN_CACHE_DIR, DOMAIN_CACHE_MAX_BYTES)
+
+
+def warm_up_domains(cache: WordlistCache, domain_cache: DomainCache, definitions: List[str]):
+    """Queue precomputation of common QAT domains (e.g. "3:*", "4:#@*") behind the wordlist's indexes."""
+    if not definitions:
+        return
+
+    def build(report_progress):
+        matcher = cache.matcher(timeout=DOMAIN_WARMUP_TIMEOUT, domain_cache=domain_cache)
+        warmed = 0
+        for i, definition in enumerate(definitions):
+            var = matcher.parse_variable_definition(f"A=({definition})")
+            if var is not None:
+                matcher.start_time = time.time()
+                matcher._all_possible_variable_values(var)
+                warmed += 1
+            report_progress((i + 1) / len(definitions))
+        return warmed
+
+    cache.indexes.register("domain warm-up", build)
+
+
+@st.cache_resource(show_spinner="Loading wordlist...", max_entries=8)
+def load_shared_wordlist(file_path: str, fingerprint: str, display_name: str, compact_membership: bool = False) -> WordlistCache:
+    """Load a wordlist once per server process; its indexes keep building across reruns and sessions.
+
+    fingerprint only takes part in the cache key, so a changed file is reloaded.
+    """
+    cache = WordlistCache(compact_membership=compact_membership)
+    if cache.load_wordlist(file_path):
+        warm_up_domains(cache, get_domain_cache(), DOMAIN_WARMUP)
+    cache.name = display_name
+    return cache
+
+
+def compile_query_plan(query: str) -> QueryPlan:
+    """Compile a query once for a whole federated run, so its errors and warnings are shown once.
+
+    Plans don't depend on the wordlist; pass the result as plan= to the functions
+    that run the query on each list.
+    """
+    return PatternMatcher([], set(), {}).compile_query(query)
+
+
+def _previous_for_cache(previous: Optional[QueryRun], cache: WordlistCache, use_substrings: bool):
+    """The part of previous that a matcher on cache may refine, or None."""
+    if previous is None or not previous.complete or previous.results is None or previous.plan is None:
+        return None
+    if previous.use_substrings != use_substrings or (cache.name, cache.fingerprint) not in previous.wordlists:
+        return None
+    results = [r for r, src in zip(previous.results, previous.sources) if cache.name in src]
+    return previous.plan, results
+
+
+def execute_federated_query(caches: List[WordlistCache], query: str, timeout: int = 60, use_substrings: bool = True, domain_cache: Optional[DomainCache] = None, previous: Optional[QueryRun] = None, isolate: bool = False, plan: Optional[QueryPlan] = None) -> QueryRun:
+    """Run one query against several loaded wordlists in parallel and merge the results.
+
+    Results found in more than one list are reported once; sources[i] names the
+    lists that produced results[i]. When previous was run on the same lists and
+    the new query only narrows it, each list filters its share of the previous
+    results instead of solving again. With isolate set, each list is searched in
+    its own child process (see run_isolated_query). plan, from compile_query_plan,
+    saves compiling the query again for every list.
+    """
+    script_ctx = get_script_run_ctx() if get_script_run_ctx else None
+    wordlists = tuple((cache.name, cache.fingerprint) for cache in caches)
+
+    def run(cache: WordlistCache):
+        if script_ctx is not None:
+            # Let st.warning/st.error from the worker reach this session
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+        matcher = cache.matcher(timeout=timeout, use_substrings=use_substrings, domain_cache=domain_cache, plan=plan)
+        refinable = _previous_for_cache(previous, cache, use_substrings)
+        if isolate:
+            # Compile before forking so the child doesn't parse the query again
+            list_plan = matcher.compile_query(query)
+            if not list_plan.valid:
+                # compile_query has already reported the errors
+                return [], "equation" if list_plan.is_equation else "definition_only", False, False, list_plan
+            results, list_type, truncated, refined = run_isolated_query(cache, query, timeout, use_substrings, domain_cache, refinable, plan=list_plan)
+            return results, list_type, truncated, refined, list_plan
+        results, list_type = matcher.execute_query(query, previous=refinable)
+        return results, list_type, matcher.truncated, matcher.refined, matcher.plan
+
+    if len(caches) == 1:
+        outcomes = [run(caches[0])]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(caches)) as executor:
+            outcomes = list(executor.map(run, caches))
+
+    merged = {}
+    sources = {}
+    result_type = None
+    timed_out = []
+    complete = not any(outcome[2] for outcome in outcomes)
+    refined = all(outcome[3] for outcome in outcomes)
+    plan = outcomes[0][4]
+    for cache, (results, list_type, _, _, _) in zip(caches, outcomes):
+        if results is None:
+            timed_out.append(cache.name)
+            continue
+        if result_type is None:
+            result_type = list_type
+        for result in results:
+            key = (result[0], result[1], tuple(sorted(result[2].items())))
+            if key not in merged:
+                merged[key] = result
+                sources[key] = []
+            sources[key].append(cache.name)
+
+    if result_type is None:
+        return QueryRun(query, plan, None, "timeout", [], use_substrings, wordlists, complete=False)
+    if timed_out:
+        st.warning(f"Query timed out on {', '.join(timed_out)}; showing results from the other wordlists.")
+
+    keys = list(merged)
+    if result_type != "equation":
+        # Each list is already sorted, keep the merged output sorted too
+        keys.sort()
+    return QueryRun(
+        query,
+        plan,
+        [merged[k] for k in keys],
+        result_type,
+        [sources[k] for k in keys],
+        use_substrings,
+        wordlists,
+        complete=complete and not timed_out,
+        refined=refined
+    )
+
+
+class _MessageRelay:
+    """Stands in for the streamlit module where there is no page to draw on, such as
+    an isolated query process or the command line, and hands st.info/st.warning/
+    st.error calls to emit(kind, text)."""
+    def __init__(self, emit):
+        self._emit = emit
+
+    def __getattr__(self, kind: str):
+        def forward(message, *args, **kwargs):
+            self._emit(kind, str(message))
+        return forward
+
+
+def _address_space_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _isolated_query_worker(conn, cache: WordlistCache, query: str, timeout: int, use_substrings: bool, domain_cache: Optional[DomainCache], previous, memory_limit_mb: int, plan: Optional[QueryPlan]):
+    global st, _plan_cache_lock
+    # Other server threads may have held these locks when the process forked
+    _plan_cache_lock = threading.Lock()
+    cache.indexes._lock = threading.Lock()
+    if domain_cache is not None:
+        domain_cache._lock = threading.Lock()
+        # The parent owns the cache's accounting, so it is told about every domain written here
+        domain_cache.on_write = lambda key: conn.send(("domain", key))
+    st = _MessageRelay(lambda kind, text: conn.send(("message", kind, text)))
+
+    if resource is not None and memory_limit_mb > 0:
+        limit = _address_space_bytes() + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    matcher = cache.matcher(timeout=timeout, use_substrings=use_substrings, domain_cache=domain_cache, plan=plan)
+    chunk = []
+    try:
+        for result in matcher.stream_query(query, previous=previous):
+            chunk.append(result)
+            if len(chunk) >= ISOLATION_CHUNK_SIZE:
+                conn.send(("chunk", chunk))
+                chunk = []
+    except MemoryError:
+        # Free what the query held so the report can still be sent
+        chunk = matcher = None
+        conn.send(("memory",))
+        conn.close()
+        return
+    if chunk:
+        conn.send(("chunk", chunk))
+    conn.send(("done", matcher.result_type, matcher.truncated, matcher.refined))
+    conn.close()
+
+
+def run_isolated_query(cache: WordlistCache, query: str, timeout: int, use_substrings: bool = True, domain_cache: Optional[DomainCache] = None, previous=None, memory_limit_mb: int = ISOLATION_MEMORY_MB, plan: Optional[QueryPlan] = None) -> Tuple[Optional[List[Tuple[str, Optional[str], Dict[str, str]]]], str, bool, bool]:
+    """Run execute_query for one wordlist in a forked child process and return
+    (results, result_type, truncated, refined).
+
+    The child shares the loaded wordlist and indexes copy-on-write, may allocate at
+    most memory_limit_mb on top of them and streams its results back in chunks as
+    stream_query produces them; domains it caches are handed to the parent's
+    DomainCache accounting. It
+    is killed if it outlives its own timeout by ISOLATION_KILL_GRACE seconds, so
+    steps that never reach a timeout check are stopped too and all of the memory
+    a query allocated goes back to the system when it ends.
+    """
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_isolated_query_worker,
+        args=(sender, cache, query, timeout, use_substrings, domain_cache, previous, memory_limit_mb, plan),
+        name="wordfinder-query",
+        daemon=True
+    )
+    process.start()
+    sender.close()
+
+    deadline = time.time() + timeout + ISOLATION_KILL_GRACE
+    results = []
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                st.error(f"Query timed out after {timeout} seconds and its process was stopped.")
+                return None, "timeout", False, False
+            if not receiver.poll(min(remaining, 0.5)):
+                continue
+            try:
+                message = receiver.recv()
+            except EOFError:
+                process.join(1)
+                st.error(f"The query process ended unexpectedly (exit code {process.exitcode}), most likely by going over its {memory_limit_mb} MB memory limit.")
+                return [], "error", False, False
+
+            if message[0] == "chunk":
+                results.extend(message[1])
+            elif message[0] == "domain":
+                if domain_cache is not None:
+                    domain_cache.adopt(message[1])
+            elif message[0] == "message":
+                if message[1] in ("info", "warning", "error"):
+                    getattr(st, message[1])(message[2])
+            elif message[0] == "memory":
+                st.error(f"The query went over its {memory_limit_mb} MB memory limit and was stopped.")
+                return [], "error", False, False
+            else:
+                _, result_type, truncated, refined = message
+                if result_type == "timeout":
+                    return None, result_type, False, False
+                if result_type == "error":
+                    return [], result_type, False, False
+                return results, result_type, truncated, refined
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+
+
+class ResultWriter:
+    """Writes results to a text stream one at a time as JSON Lines, CSV or plain text.
+
+    CSV has one column per variable of the query; JSON Lines keeps the bindings
+    as an object. A wordlist column is added when results come from several lists.
+    """
+    def __init__(self, out, fmt: str, var_names: List[str], with_source: bool = False):
+        self.out = out
+        self.fmt = fmt
+        self.var_names = var_names
+        self.with_source = with_source
+        if fmt == "csv":
+            self._csv = csv.writer(out, lineterminator="\n")
+            self._csv.writerow(["word", "second_word", *var_names] + (["wordlist"] if with_source else []))
+
+    def write(self, result: Tuple[str, Optional[str], Dict[str, str]], source: str = ""):
+        word1, word2, decomp = result
+        if self.fmt == "jsonl":
+            record = {"word": word1, "second_word": word2, "bindings": decomp}
+            if self.with_source:
+                record["wordlist"] = source
+            self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        elif self.fmt == "csv":
+            row = [word1, word2 or "", *(decomp.get(name, "") for name in self.var_names)]
+            self._csv.writerow(row + ([source] if self.with_source else []))
+        else:
+            line = word1 if word2 is None else f"{word1} / {word2}"
+            if decomp:
+                line += "    (" + " - ".join(f"{k}={v}" for k, v in sorted(decomp.items())) + ")"
+            if self.with_source:
+                line += f"    [{source}]"
+            self.out.write(line + "\n")
+
+
+def export_query(caches: List[WordlistCache], query: str, fmt: str, out, timeout: int = 60, use_substrings: bool = True, domain_cache: Optional[DomainCache] = None, plan: Optional[QueryPlan] = None) -> Tuple[int, bool]:
+    """Stream every result of query on each wordlist to out and return (results written, complete).
+
+    Results go from the solvers to out one at a time, so neither the result set nor
+    its formatted text is ever held in memory. For the same reason results found in
+    several wordlists are not merged; each row names its list instead.
+    """
+    writer = None
+    written = 0
+    complete = True
+    for cache in caches:
+        matcher = cache.matcher(timeout=timeout, use_substrings=use_substrings, domain_cache=domain_cache, plan=plan)
+        for result in matcher.iter_query(query):
+            if writer is None:
+                writer = ResultWriter(out, fmt, sorted(matcher.plan.variables), with_source=len(caches) > 1)
+            writer.write(result, cache.name)
+            written += 1
+        plan = matcher.plan
+        complete = complete and not matcher.truncated
+    if writer is None and plan is not None:
+        # Still write the CSV header for an empty export
+        ResultWriter(out, fmt, sorted(plan.variables), with_source=len(caches) > 1)
+    return written, complete
+
+
+def estimate_federated_query(caches: List[WordlistCache], query: str, use_substrings: bool = True, domain_cache: Optional[DomainCache] = None, sample_matches: int = ESTIMATE_SAMPLE_MATCHES, plan: Optional[QueryPlan] = None, timeout: int = 60) -> List[Tuple[str, QueryEstimate]]:
+    """Estimate a query on each wordlist, splitting the time budget between them."""
+    estimates = []
+    for cache in caches:
+        matcher = cache.matcher(timeout=timeout, use_substrings=use_substrings, domain_cache=domain_cache, plan=plan)
+        estimate = matcher.estimate_query(query, time_budget=ESTIMATE_TIME_BUDGET / len(caches), sample_matches=sample_matches)
+        estimates.append((cache.name, estimate))
+    return estimates
+
+
+def format_estimate(name: str, estimate: QueryEstimate) -> str:
+    if estimate.exact:
+        count = f"exactly {estimate.hits:,} results"
+    else:
+        count = f"about {estimate.count:,.0f} results"
+        if estimate.approximate:
+            count += f" (rough range {estimate.count_low:,.0f} to {estimate.count_high:,.0f}; some variable domains were too large to build, so their sizes are guesses)"
+        else:
+            count += f" (95% range {estimate.count_low:,.0f} to {estimate.count_high:,.0f})"
+    return (
+        f"{name}: {count}, solving takes about {estimate.seconds:.1f} s "
+        f"({estimate.seconds_low:.1f} to {estimate.seconds_high:.1f} s). "
+        f"Checked {estimate.checked:,} of {estimate.population:,.0f} candidates."
+    )
+
+
+def estimate_federated_cost(caches: List[WordlistCache], query: str, use_substrings: bool = True, previous: Optional[QueryRun] = None, plan: Optional[QueryPlan] = None) -> float:
+    cost = 0.0
+    for cache in caches:
+        matcher = cache.matcher(use_substrings=use_substrings, plan=plan)
+        refinable = _previous_for_cache(previous, cache, use_substrings)
+        if refinable is not None and matcher.is_narrowing(refinable[0], matcher.compile_query(query)):
+            # Only the previous results need to be filtered
+            cost += len(refinable[1])
+        else:
+            cost += matcher.estimate_query_cost(query)
+    return cost
 
 
-def format_results(results: Optional[List[Tuple[str, Optional[str], Dict[str, str]]]], result_type: str, max_disp: int) -> str:
+class QueryTicket:
+    """Handle for a query submitted to the QueryScheduler."""
+    def __init__(self, session_id: str, run_fn, timeout: int, cost: float):
+        self.session_id = session_id
+        self.run_fn = run_fn  # called with the (possibly downgraded) timeout
+        self.timeout = timeout
+        self.cost = cost
+        self.state = "queued"  # queued, running, done, rejected or cancelled
+        self.message = ""
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.script_ctx = get_script_run_ctx() if get_script_run_ctx else None
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _finish(self, state: str):
+        self.state = state
+        self._done.set()
+
+
+class QueryScheduler:
+    """Process-wide bounded worker pool shared by every Streamlit session.
+
+    Sessions are served round robin so one user's queue can't starve the
+    others, and queries are admitted by estimated cost: runaway ones are
+    rejected outright and expensive ones run with a shorter timeout.
+    """
+    def __init__(self, max_workers: int, max_cost: float, downgrade_cost: float, downgrade_timeout: int, max_queued_per_session: int = 3):
+        self.max_cost = max_cost
+        self.downgrade_cost = downgrade_cost
+        self.downgrade_timeout = downgrade_timeout
+        self.max_queued_per_session = max_queued_per_session
+        self._queues: "OrderedDict[str, List[QueryTicket]]" = OrderedDict()
+        # Running tickets count toward the session limit too: a query the user
+        # navigated away from keeps its worker busy until it finishes
+        self._running: Dict[str, int] = defaultdict(int)
+        self._cond = threading.Condition()
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"query-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, session_id: str, run_fn, timeout: int, cost: float) -> QueryTicket:
+        ticket = QueryTicket(session_id, run_fn, timeout, cost)
+        if cost > self.max_cost:
+            ticket.message = f"Query rejected: an estimated {cost:.3g} candidate checks is over the server limit of {self.max_cost:.3g}. Narrow the variable patterns or lengths."
+            ticket._finish("rejected")
+            return ticket
+        if cost > self.downgrade_cost and timeout > self.downgrade_timeout:
+            ticket.timeout = self.downgrade_timeout
+            ticket.message = f"Expensive query (about {cost:.3g} candidate checks): timeout lowered to {self.downgrade_timeout} seconds."
+
+        with self._cond:
+            queue = self._queues.setdefault(session_id, [])
+            if len(queue) + self._running.get(session_id, 0) >= self.max_queued_per_session:
+                if not queue:
+                    del self._queues[session_id]
+                ticket.message = "Too many queries queued or running for this session; wait for the earlier ones to finish."
+                ticket._finish("rejected")
+                return ticket
+            queue.append(ticket)
+            self._cond.notify()
+        return ticket
+
+    def cancel(self, ticket: QueryTicket) -> bool:
+        """Drop a ticket that hasn't started yet."""
+        with self._cond:
+            queue = self._queues.get(ticket.session_id)
+            if ticket.state != "queued" or not queue or ticket not in queue:
+                return False
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.session_id]
+            ticket._finish("cancelled")
+            return True
+
+    def position(self, ticket: QueryTicket) -> int:
+        """Number of queued tickets that will be dispatched before this one (0 once running)."""
+        with self._cond:
+            queue = self._queues.get(ticket.session_id)
+            if ticket.state != "queued" or not queue or ticket not in queue:
+                return 0
+            rank = queue.index(ticket)
+            ahead = rank
+            before_in_rotation = True
+            for session_id, other in self._queues.items():
+                if session_id == ticket.session_id:
+                    before_in_rotation = False
+                    continue
+                # Round robin: sessions earlier in the rotation also get a turn at this rank
+                ahead += min(len(other), rank + 1 if before_in_rotation else rank)
+            return ahead
+
+    def _next_ticket(self) -> QueryTicket:
+        # Called with the condition held: take the head of the next session in rotation
+        session_id, queue = next(iter(self._queues.items()))
+        ticket = queue.pop(0)
+        del self._queues[session_id]
+        if queue:
+            self._queues[session_id] = queue
+        return ticket
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                ticket = self._next_ticket()
+                ticket.state = "running"
+                self._running[ticket.session_id] += 1
+
+            if ticket.script_ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ticket.script_ctx)
+            try:
+                ticket.result = ticket.run_fn(ticket.timeout)
+            except BaseException as e:
+                ticket.error = e
+            with self._cond:
+                self._running[ticket.session_id] -= 1
+                if not self._running[ticket.session_id]:
+                    del self._running[ticket.session_id]
+            ticket._finish("done")
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_scheduler() -> QueryScheduler:
+    return QueryScheduler(
+        max_workers=QUERY_WORKERS,
+        max_cost=QUERY_MAX_COST,
+        downgrade_cost=QUERY_DOWNGRADE_COST,
+        downgrade_timeout=QUERY_DOWNGRADE_TIMEOUT
+    )
+
+
+def format_results(results: Optional[List[Tuple[str, Optional[str], Dict[str, str]]]], result_type: str, max_disp: int, sources: Optional[List[List[str]]] = None, total: Optional[int] = None, start: int = 0) -> str:
+    """Format results for display. For a page of a larger result set, pass the full count as total and the page's offset as start."""
     if results is None:
         return "Query execution timed out."
     if not results and result_type != "definition_only":
@@ -951,7 +2663,7 @@ def format_results(results: Optional[List[Tuple[str, Optional[str], Dict[str, st
     if not results and result_type == "definition_only":
         return ""
 
-    num_results = len(results)
+    num_results = len(results) if total is None else total
     output = [f"Found {num_results} matches:"]
     output.append("---")
 
@@ -964,46 +2676,430 @@ def format_results(results: Optional[List[Tuple[str, Optional[str], Dict[str, st
             decomp_str = " - ".join(decomp_parts)
 
             if word2 is None:
-                output.append(f"{word1}    ({decomp_str})")
+                line = f"{word1}    ({decomp_str})"
             else:
-                output.append(f"{word1} / {word2}    ({decomp_str})")
+                line = f"{word1} / {word2}    ({decomp_str})"
+            if sources is not None:
+                line += f"    [{', '.join(sources[displayed_count])}]"
+            output.append(line)
             displayed_count += 1
     else:
         for res_tuple in results:
             if displayed_count >= max_disp: break
             word, _, _ = res_tuple
-            output.append(word)
+            if sources is not None:
+                output.append(f"{word}    [{', '.join(sources[displayed_count])}]")
+            else:
+                output.append(word)
             displayed_count += 1
 
-    if num_results > max_disp:
+    if total is not None:
+        if num_results > displayed_count:
+            output.append(f"\n... (displaying {start + 1}-{start + displayed_count} of {num_results} results)")
+    elif num_results > max_disp:
         output.append(f"\n... (displaying {max_disp} of {num_results} results)")
 
     return "\n".join(output)
 
 
-if st.button("Execute Search", key="execute_button"):
-    query = query_input
-    if not query:
-        st.warning("Please enter a query pattern.")
-    elif not word_cache.wordlist:
-         st.error("No wordlist is loaded. Please select or upload a wordlist from the sidebar.")
-    else:
-        with st.spinner("Searching... This may take time for complex queries."):
-             start_exec_time = time.time()
-             matcher = PatternMatcher(
-                 word_cache.wordlist,
-                 word_cache.words_set,
-                 word_cache.word_by_length,
-                 timeout=timeout_seconds,
-                 use_substrings=use_substrings
-             )
-             results_data, result_type = matcher.execute_query(query)
-             end_exec_time = time.time()
-             execution_time = end_exec_time - start_exec_time
-
-             if results_data is not None:
-                  formatted_output = format_results(results_data, result_type, max_results)
-                  result_prefix = f"Search completed in {execution_time:.2f} seconds.\n\n"
-                  st.text_area("Results", result_prefix + formatted_output, height=400, key="results_area")
-             else:
-                  st.text_area("Results", f"Search timed out after {timeout_seconds} seconds.", height=68, key="results_area_timeou")
+def run_scheduled(run_fn, timeout: int, cost: float) -> QueryTicket:
+    """Submit run_fn for this session to the shared scheduler and wait for it, showing its queue position."""
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    scheduler = get_query_scheduler()
+    ticket = scheduler.submit(session_id, run_fn, timeout=timeout, cost=cost)
+    if ticket.state == "rejected":
+        st.error(ticket.message)
+        st.stop()
+    if ticket.message:
+        st.warning(ticket.message)
+
+    queue_status = st.empty()
+    try:
+        while not ticket.wait(0.5):
+            position = scheduler.position(ticket)
+            if ticket.state == "queued":
+                queue_status.info(f"Waiting for a free worker: {position} queries ahead of yours.")
+            else:
+                queue_status.info("Running...")
+    finally:
+        # The user navigated away while still queued
+        scheduler.cancel(ticket)
+    queue_status.empty()
+
+    if ticket.error is not None:
+        raise ticket.error
+    return ticket
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ExportFile:
+    """An export written for one session.
+
+    Streamlit gives no notice when a session ends beyond dropping its state, so
+    the file is deleted when this object, kept in session state, is collected.
+    """
+    def __init__(self, path: str, file_name: str, mime: str, summary: str):
+        self.path = path
+        self.file_name = file_name
+        self.mime = mime
+        self.summary = summary
+        self.delete = weakref.finalize(self, _remove_file, path)
+
+
+def _remove_stale_exports():
+    """Delete exports older than EXPORT_MAX_AGE, left behind when the server stopped without collecting its sessions."""
+    cutoff = time.time() - EXPORT_MAX_AGE
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.name.startswith("wordfinder_export_") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _write_export(caches: List[WordlistCache], query: str, fmt: str, extension: str, timeout: int, use_substrings: bool, domain_cache: DomainCache, plan: QueryPlan) -> Tuple[str, int, bool]:
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _remove_stale_exports()
+    # mkstemp's random name keeps the static URL unguessable
+    fd, path = tempfile.mkstemp(prefix="wordfinder_export_", suffix="." + extension, dir=EXPORT_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8", newline="") as out:
+        written, complete = export_query(caches, query, fmt, out, timeout=timeout, use_substrings=use_substrings, domain_cache=domain_cache, plan=plan)
+    return path, written, complete
+
+
+def main():
+    st.set_page_config(
+        page_title="Word Pattern Matcher",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    word_caches: Dict[str, WordlistCache] = {}
+
+    st.sidebar.title("Word Pattern Matcher")
+    st.sidebar.header("Load Wordlists")
+
+    script_dir = os.path.dirname(__file__) if "__file__" in globals() else os.getcwd()
+    default_wordlist_path = os.path.join(script_dir, "default_wordlist.txt")
+    broda_wordlist_path = os.path.join(script_dir, "broda_wordlist.txt")
+    broda_exists = os.path.exists(broda_wordlist_path)
+
+    options = ["Upload custom wordlist", "Use default wordlist"]
+    if broda_exists:
+        options.append("Use Broda wordlist")
+
+    wordlist_options = st.sidebar.multiselect(
+        "Select wordlists",
+        options,
+        default=["Use default wordlist"],
+        help="Selecting more than one list searches all of them in a single query and tags each result with its source."
+    )
+    compact_membership = st.sidebar.checkbox(
+        "Compact membership index",
+        value=False,
+        help="Keep the loaded words in packed byte arrays instead of Python strings. Uses a small fraction of the memory, but every lookup is about a hundred times slower and the anagram and split indexes are not built."
+    )
+
+    # (option, path to load, display name)
+    wordlists_to_load = []
+    if "Upload custom wordlist" in wordlist_options:
+        uploaded_file = st.sidebar.file_uploader("Upload your wordlist (.txt)", type=["txt"])
+        if uploaded_file is not None:
+            upload_hash = hashlib.sha1(uploaded_file.getbuffer()).hexdigest()
+            temp_path = os.path.join(script_dir, f"temp_uploaded_wordlist_{upload_hash[:12]}.txt")
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+                wordlists_to_load.append(("Upload custom wordlist", temp_path, uploaded_file.name))
+            except Exception as e:
+                st.sidebar.error(f"Failed to save uploaded file: {e}")
+        else:
+            st.sidebar.info("Please upload a wordlist file (.txt)")
+
+    if "Use default wordlist" in wordlist_options:
+        if not os.path.exists(default_wordlist_path):
+            try:
+                with open(default_wordlist_path, "w") as f:
+                    for word in ["landform", "linoleum", "loom", "logjam", "lipbalm",
+                                     ]:
+                         f.write(word + "\n")
+                st.sidebar.info("Created default wordlist.")
+            except Exception as e:
+                st.sidebar.error(f"Failed to create default wordlist: {e}")
+        wordlists_to_load.append(("Use default wordlist", default_wordlist_path, os.path.basename(default_wordlist_path)))
+
+    if "Use Broda wordlist" in wordlist_options:
+        if broda_exists:
+            wordlists_to_load.append(("Use Broda wordlist", broda_wordlist_path, os.path.basename(broda_wordlist_path)))
+        else:
+            st.sidebar.error("Broda wordlist selected but not found.")
+
+    for wordlist_option, loaded_wordlist_path, display_name in wordlists_to_load:
+        if display_name in word_caches:
+            continue
+        try:
+            file_stat = os.stat(loaded_wordlist_path)
+            fingerprint = f"{file_stat.st_size}:{file_stat.st_mtime_ns}"
+            if wordlist_option == "Upload custom wordlist":
+                fingerprint = os.path.basename(loaded_wordlist_path)
+        except OSError:
+            fingerprint = ""
+        cache = load_shared_wordlist(loaded_wordlist_path, fingerprint, display_name, compact_membership)
+        word_count = len(cache.wordlist)
+        if word_count > 0:
+            st.sidebar.success(f"Loaded {word_count} words from {display_name}")
+            word_caches[display_name] = cache
+        else:
+            st.sidebar.error(f"Failed to load wordlist {display_name} or wordlist is empty.")
+        if wordlist_option == "Upload custom wordlist" and os.path.exists(loaded_wordlist_path):
+              try:
+                  os.remove(loaded_wordlist_path)
+              except Exception as e:
+                  st.sidebar.warning(f"Could not remove temporary file {loaded_wordlist_path}: {e}")
+
+    building = False
+    for cache in word_caches.values():
+        for status in cache.indexes.statuses():
+            if status.state in ("pending", "building"):
+                building = True
+                st.sidebar.progress(status.progress, text=f"{cache.name}: building {status.name} index")
+            elif status.state == "failed":
+                st.sidebar.warning(f"{cache.name}: {status.name} index failed ({status.error}); using plain scans.")
+    if building:
+        st.sidebar.caption("Queries already work and speed up as indexes come online.")
+        st.sidebar.button("Refresh index status")
+
+    if not word_caches and 'first_run_done' not in st.session_state:
+          st.sidebar.warning("No wordlist loaded. Please select or upload one.")
+          st.session_state['first_run_done'] = True
+
+
+    with st.sidebar.expander("Advanced Options"):
+
+        use_threading = False
+        max_results = st.number_input("Results per page", min_value=10, max_value=10000, value=1000)
+        timeout_seconds = st.number_input("Query timeout (seconds)", min_value=5, max_value=2000, value=120)
+        use_substrings = st.checkbox("Allow variable values to be any substring (QAT mode)", value=True, help="If checked, variables can be any substring matching the pattern/length, not just dictionary words. Required for QAT-style queries.")
+        isolate_queries = st.checkbox(
+            "Run queries in an isolated process",
+            value=False,
+            disabled=not ISOLATION_AVAILABLE,
+            help=f"Each search runs in a child process that may use at most {ISOLATION_MEMORY_MB} MB of extra memory and is killed once it overruns the timeout, so a runaway query can't hold on to server memory. Needs a platform that supports fork."
+        )
+
+    st.title("Word Pattern Matcher")
+    st.write("Search wordlists using patterns and variable equations.")
+
+
+    query_input = st.text_area("Enter your query pattern",
+                               height=150)
+
+    search_col, estimate_col = st.columns(2)
+    search_clicked = search_col.button("Execute Search", key="execute_button")
+    estimate_clicked = estimate_col.button(
+        "Estimate",
+        key="estimate_button",
+        help="Sample the query for under a second to estimate how many results it has and how long it takes, without running it."
+    )
+
+    if estimate_clicked:
+        if not query_input:
+            st.warning("Please enter a query pattern.")
+        elif not word_caches:
+            st.error("No wordlist is loaded. Please select or upload a wordlist from the sidebar.")
+        else:
+            caches = list(word_caches.values())
+            plan = compile_query_plan(query_input)
+            with st.spinner("Estimating..."):
+                ticket = run_scheduled(
+                    lambda timeout: estimate_federated_query(caches, query_input, use_substrings, get_domain_cache(), plan=plan, timeout=timeout),
+                    timeout=timeout_seconds,
+                    # Each list checks at most ESTIMATE_MAX_SAMPLES candidates
+                    cost=float(ESTIMATE_MAX_SAMPLES * len(caches))
+                )
+            estimates = ticket.result
+            st.info("\n\n".join(format_estimate(name, estimate) for name, estimate in estimates))
+            if max(estimate.seconds_low for _, estimate in estimates) > timeout_seconds:
+                st.warning(f"This query will probably exceed the {timeout_seconds} second timeout. Consider narrowing it.")
+            samples = [result for _, estimate in estimates for result in estimate.sample_results]
+            if samples:
+                st.text_area(
+                    "Sample matches",
+                    format_results(samples, estimates[0][1].result_type, len(samples)),
+                    height=200
+                )
+
+    if search_clicked:
+        query = query_input
+        if not query:
+            st.warning("Please enter a query pattern.")
+        elif not word_caches:
+             st.error("No wordlist is loaded. Please select or upload a wordlist from the sidebar.")
+        else:
+            with st.spinner("Searching... This may take time for complex queries."):
+                 start_exec_time = time.time()
+                 caches = list(word_caches.values())
+                 previous_run = st.session_state.get("last_query_run")
+                 plan = compile_query_plan(query)
+                 ticket = run_scheduled(
+                     lambda timeout: execute_federated_query(
+                         caches,
+                         query,
+                         timeout=timeout,
+                         use_substrings=use_substrings,
+                         domain_cache=get_domain_cache(),
+                         previous=previous_run,
+                         isolate=isolate_queries,
+                         plan=plan
+                     ),
+                     timeout=timeout_seconds,
+                     cost=estimate_federated_cost(caches, query, use_substrings, previous=previous_run, plan=plan)
+                 )
+                 query_run = ticket.result
+                 results_data = query_run.results
+                 end_exec_time = time.time()
+                 execution_time = end_exec_time - start_exec_time
+
+                 if results_data is not None:
+                      st.session_state["last_query_run"] = query_run
+                      summary = f"Search completed in {execution_time:.2f} seconds."
+                      if query_run.refined:
+                          summary = f"Search completed in {execution_time:.2f} seconds by filtering the previous query's results."
+                 else:
+                      summary = f"Search timed out after {ticket.timeout} seconds."
+                 st.session_state["displayed_run"] = query_run
+                 st.session_state["displayed_summary"] = summary
+                 st.session_state["results_page"] = 1
+
+    with st.expander("Export all results"):
+        st.caption("Writes every result, without the page size or result cap, to a file you can download.")
+        export_label = st.selectbox("Export format", list(EXPORT_FORMATS))
+        if st.button("Prepare export", key="export_button"):
+            if not query_input:
+                st.warning("Please enter a query pattern.")
+            elif not word_caches:
+                st.error("No wordlist is loaded. Please select or upload a wordlist from the sidebar.")
+            else:
+                fmt, extension, mime = EXPORT_FORMATS[export_label]
+                caches = list(word_caches.values())
+                plan = compile_query_plan(query_input)
+                with st.spinner("Exporting..."):
+                    ticket = run_scheduled(
+                        lambda timeout: _write_export(caches, query_input, fmt, extension, timeout, use_substrings, get_domain_cache(), plan),
+                        timeout=timeout_seconds,
+                        cost=estimate_federated_cost(caches, query_input, use_substrings, plan=plan)
+                    )
+                path, written, complete = ticket.result
+                previous_export = st.session_state.get("export_file")
+                if previous_export is not None:
+                    previous_export.delete()
+                summary = f"{written} results exported."
+                if not complete:
+                    summary = f"{written} results exported before the query timed out; the file is incomplete."
+                st.session_state["export_file"] = ExportFile(path, f"wordfinder_results.{extension}", mime, summary)
+
+        export_file = st.session_state.get("export_file")
+        if export_file is not None and os.path.exists(export_file.path):
+            st.caption(export_file.summary)
+            if st.get_option("server.enableStaticServing") and os.path.getsize(export_file.path) <= STATIC_SERVING_MAX_BYTES:
+                # Streamed from disk by the static file server instead of loaded into memory on every rerun
+                url = "app/static/" + os.path.relpath(export_file.path, STATIC_DIR).replace(os.sep, "/")
+                st.markdown(f'<a href="{url}" download="{export_file.file_name}">Download export</a>', unsafe_allow_html=True)
+            else:
+                with open(export_file.path, "rb") as f:
+                    st.download_button("Download export", f, file_name=export_file.file_name, mime=export_file.mime)
+
+    # Results live in session state, so changing display options below never re-runs the search
+    displayed_run = st.session_state.get("displayed_run")
+    if displayed_run is not None:
+        summary = st.session_state.get("displayed_summary", "")
+        if displayed_run.results is None:
+            st.text_area("Results", summary, height=68)
+        else:
+            sort_col, filter_col, page_col = st.columns(3)
+            sort_label = sort_col.selectbox("Sort results", list(RESULT_SORT_ORDERS))
+            filter_text = filter_col.text_input("Filter displayed results", help="Only show rows containing this text.")
+            shown_count = len(displayed_run.view(RESULT_SORT_ORDERS[sort_label], filter_text))
+            page_count = max(1, -(-shown_count // max_results))
+            if st.session_state.get("results_page", 1) > page_count:
+                st.session_state["results_page"] = page_count
+            page = page_col.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, key="results_page")
+
+            page_results, page_sources, shown_count = displayed_run.page(page, max_results, RESULT_SORT_ORDERS[sort_label], filter_text)
+            if filter_text.strip() and displayed_run.results:
+                summary += f" {shown_count} of {len(displayed_run.results)} results match the filter."
+            formatted_output = format_results(
+                page_results,
+                displayed_run.result_type,
+                max_results,
+                sources=page_sources if len(displayed_run.wordlists) > 1 else None,
+                total=shown_count,
+                start=(page - 1) * max_results
+            )
+            st.text_area("Results", summary + "\n\n" + formatted_output, height=400)
+
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    """Command-line export: stream every result of a query to a file or stdout."""
+    global st
+    parser = argparse.ArgumentParser(description="Search wordlists with patterns and variable equations and write every result.")
+    parser.add_argument("query", help='query in the app\'s syntax, e.g. "A=(3:*);B=(3:*);AB;BA"')
+    parser.add_argument("wordlists", nargs="+", help="wordlist files, one word per line")
+    parser.add_argument("--format", choices=[fmt for fmt, _, _ in EXPORT_FORMATS.values()], default="txt")
+    parser.add_argument("--output", "-o", help="file to write, stdout by default")
+    parser.add_argument("--timeout", type=int, default=600, help="per-wordlist timeout in seconds")
+    parser.add_argument("--words", action="store_true", help="bind variables to dictionary words instead of any substring (QAT mode)")
+    parser.add_argument("--compact-membership", action="store_true", help="keep the words in packed byte arrays instead of Python strings: far less memory, slower lookups, no anagram or split index")
+    args = parser.parse_args(argv)
+
+    st = _MessageRelay(lambda kind, text: print(f"{kind}: {text}", file=sys.stderr))
+    caches = []
+    for path in args.wordlists:
+        cache = WordlistCache(compact_membership=args.compact_membership)
+        if not cache.load_wordlist(path):
+            print(f"error: no words loaded from {path}", file=sys.stderr)
+            return 2
+        caches.append(cache)
+
+    plan = compile_query_plan(args.query)
+    if not plan.valid:
+        # compile_query has already printed why
+        return 2
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        written, complete = export_query(
+            caches,
+            args.query,
+            args.format,
+            out,
+            timeout=args.timeout,
+            use_substrings=not args.words,
+            domain_cache=DomainCache(DOMAIN_CACHE_DIR, DOMAIN_CACHE_MAX_BYTES),
+            plan=plan
+        )
+    except BrokenPipeError:
+        # The reader, e.g. `head`, closed stdout early
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if args.output:
+            out.close()
+    print(f"{written} results written" + ("" if complete else " before the query timed out"), file=sys.stderr)
+    return 0 if complete else 1
+
+
+if __name__ == "__main__":
+    if get_script_run_ctx is not None and get_script_run_ctx() is None:
+        # Run as a plain script rather than through `streamlit run`
+        sys.exit(cli())
+    main()
@@ -0,0 +1,254 @@
+"""Drive PatternMatcher.execute_query from many concurrent simulated sessions.
+
+Sessions are worker threads sharing one loaded wordlist, or forked worker
+processes sharing it copy-on-write. Queries arrive as a Poisson stream at
+--rate per second; with --rate 0 every session sends its next query as soon
+as the previous one finishes. Reports throughput, latency percentiles
+(arrival to completion, so queueing counts) and peak memory of all workers
+together. PSS splits pages shared between processes fairly, so it is the
+better measure of what each extra process costs.
+
+The query mix file has one "weight query" pair per line, # starts a comment.
+
+Usage:
+    python load_test.py path/to/wordlist.txt --sessions 16 --rate 20
+    python load_test.py --synthetic 500000 --mode processes --sessions 8 --rate 0
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+
+from bench_membership import synthetic_wordlist
+from final_wordfinder import WordlistCache
+
+DEFAULT_MIX = [
+    (5, "l*"),
+    (5, "5:s*"),
+    (3, "/tsar"),
+    (2, "/ts.r"),
+    (3, "A=(2:*);B=(3:*);AB"),
+    (2, "A=(3:*);~A"),
+    (1, "A=(3:*);B=(3:*);AB;BA"),
+]
+
+
+def read_mix(path: str):
+    mix = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            weight, query = line.split(None, 1)
+            mix.append((float(weight), query.strip()))
+    return mix
+
+
+def run_session(cache: WordlistCache, tasks, results, use_substrings: bool, timeout: int):
+    """Worker loop: take (query, arrival) tasks until None and report each outcome."""
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        query, arrival = task
+        started = time.monotonic()
+        matcher = cache.matcher(timeout=timeout, use_substrings=use_substrings)
+        try:
+            found, _ = matcher.execute_query(query)
+            status, count = ("timeout", 0) if found is None else ("ok", len(found))
+        except Exception:
+            status, count = "error", 0
+        results.put((query, arrival, started, time.monotonic(), status, count))
+
+
+def process_memory(pid: int):
+    """(rss, pss) in bytes; pss falls back to rss where smaps_rollup is unavailable."""
+    rss = pss = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1]) * 1024
+        return rss, pss
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss, rss
+
+
+class MemorySampler(threading.Thread):
+    """Tracks the peak summed RSS and PSS of a set of processes."""
+    def __init__(self, pids, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_pss = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        totals = [process_memory(pid) for pid in self.pids]
+        self.peak_rss = max(self.peak_rss, sum(rss for rss, _ in totals))
+        self.peak_pss = max(self.peak_pss, sum(pss for _, pss in totals))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sample()
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile: the smallest value with at least fraction of the values at or below it."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wordlist", nargs="?", help="wordlist file, one word per line")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate this many random words instead of reading a file")
+    parser.add_argument("--mode", choices=("threads", "processes"), default="threads")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions (worker threads or processes)")
+    parser.add_argument("--rate", type=float, default=10.0, help="query arrivals per second across all sessions, 0 for back-to-back")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep sending queries")
+    parser.add_argument("--mix", help="query mix file, one 'weight query' pair per line")
+    parser.add_argument("--words", action="store_true", help="bind variables to dictionary words instead of substrings (QAT mode)")
+    parser.add_argument("--timeout", type=int, default=60, help="per-query timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode == "processes" and "fork" not in multiprocessing.get_all_start_methods():
+        parser.error("--mode processes needs a platform that supports fork")
+
+    temp_path = None
+    if args.synthetic:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("\n".join(synthetic_wordlist(args.synthetic, args.seed)))
+            temp_path = f.name
+        path = temp_path
+    elif args.wordlist:
+        path = args.wordlist
+    else:
+        parser.error("give a wordlist path or --synthetic N")
+
+    load_start = time.perf_counter()
+    cache = WordlistCache()
+    word_count = cache.load_wordlist(path)
+    if temp_path is not None:
+        os.remove(temp_path)
+    if not word_count:
+        parser.error("wordlist is empty")
+    while not cache.indexes.all_ready():
+        time.sleep(0.1)
+    print(f"{word_count} words loaded and indexed in {time.perf_counter() - load_start:.1f} s")
+
+    mix = read_mix(args.mix) if args.mix else DEFAULT_MIX
+    queries = [query for _, query in mix]
+    weights = [weight for weight, _ in mix]
+    rng = random.Random(args.seed)
+
+    if args.mode == "threads":
+        tasks, results = queue.Queue(), queue.Queue()
+        workers = [
+            threading.Thread(target=run_session, args=(cache, tasks, results, not args.words, args.timeout), daemon=True)
+            for _ in range(args.sessions)
+        ]
+    else:
+        # Forked after loading, so every worker shares the wordlist and indexes copy-on-write
+        context = multiprocessing.get_context("fork")
+        tasks, results = context.Queue(), context.Queue()
+        workers = [
+            context.Process(target=run_session, args=(cache, tasks, results, not args.words, args.timeout), daemon=True)
+            for _ in range(args.sessions)
+        ]
+    for worker in workers:
+        worker.start()
+    pids = [os.getpid()] + ([worker.pid for worker in workers] if args.mode == "processes" else [])
+    sampler = MemorySampler(pids)
+    sampler.start()
+
+    def send():
+        tasks.put((rng.choices(queries, weights)[0], time.monotonic()))
+
+    start = time.monotonic()
+    end = start + args.duration
+    sent = 0
+    if args.rate > 0:
+        def dispatch():
+            nonlocal sent
+            next_arrival = start
+            while True:
+                next_arrival += rng.expovariate(args.rate)
+                if next_arrival >= end:
+                    return
+                time.sleep(max(0.0, next_arrival - time.monotonic()))
+                send()
+                sent += 1
+
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        dispatcher.start()
+    else:
+        dispatcher = None
+        for _ in range(args.sessions):
+            send()
+            sent += 1
+
+    outcomes = []
+    while dispatcher is not None and dispatcher.is_alive() or len(outcomes) < sent:
+        try:
+            outcome = results.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        outcomes.append(outcome)
+        if dispatcher is None and time.monotonic() < end:
+            send()
+            sent += 1
+    finished = time.monotonic()
+
+    for _ in workers:
+        tasks.put(None)
+    for worker in workers:
+        worker.join()
+    sampler.stop()
+
+    elapsed = finished - start
+    latencies = sorted(done - arrival for _, arrival, _, done, _, _ in outcomes)
+    services = sorted(done - started for _, _, started, done, _, _ in outcomes)
+    statuses = [status for *_, status, _ in outcomes]
+    print(f"mode={args.mode} sessions={args.sessions} rate={'back-to-back' if args.rate <= 0 else f'{args.rate:g}/s'} duration={elapsed:.1f} s")
+    print(f"completed {statuses.count('ok')}, timed out {statuses.count('timeout')}, failed {statuses.count('error')}, throughput {len(outcomes) / elapsed:.2f} queries/s")
+    print(f"{'ms':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, values in (("latency", latencies), ("service", services)):
+        print(f"{name:<10} " + " ".join(f"{percentile(values, p) * 1000:>9.1f}" for p in (0.50, 0.95, 0.99, 1.0)))
+    print(f"peak RSS {sampler.peak_rss / 2**20:.1f} MiB, peak PSS {sampler.peak_pss / 2**20:.1f} MiB across {len(pids)} process(es)")
+
+    print(f"\n{'query':<32} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'results':>8}")
+    for query in queries:
+        runs = [o for o in outcomes if o[0] == query]
+        query_latencies = sorted(done - arrival for _, arrival, _, done, _, _ in runs)
+        count = runs[-1][5] if runs else 0
+        print(f"{query:<32} {len(runs):>6} {percentile(query_latencies, 0.5) * 1000:>9.1f} {percentile(query_latencies, 0.95) * 1000:>9.1f} {count:>8}")
+
+
+if __name__ == "__main__":
+    main()